@@ -0,0 +1,188 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import timeit
+
+from bitboard import BitGrid
+from grid import DIRECTIONS, Grid
+from player_ai import PlayerAI
+from simulate import ENGINES
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'benchmark_corpus.json')
+DIRECTION_NAMES = ('up', 'down', 'left', 'right')
+
+
+def record_corpus(sizes=((4, 4), (5, 5), (6, 6)), seeds=(0, 1),
+                  stages=(0.5, 0.9), time_limit=0.02, max_moves=800):
+    """Plays seeded games and returns the boards at the given fractions of
+    each game, by board size.
+    """
+    corpus = {}
+    for height, width in sizes:
+        boards = corpus[f'{height}x{width}'] = []
+        for seed in seeds:
+            grid = BitGrid(height=height, width=width,
+                           rng=random.Random(seed))
+            player_ai = PlayerAI(time_limit)
+            for _ in range(2):
+                grid.insert_random_tile()
+            history = []
+            while grid.can_move() and len(history) < max_moves:
+                move = player_ai.get_move(grid)
+                if move is None or not grid.move(move):
+                    break
+                grid.insert_random_tile()
+                history.append(grid.grid)
+            boards.extend(
+                history[int(stage * (len(history) - 1))] for stage in stages)
+    return corpus
+
+
+def load_corpus(path=CORPUS):
+    """Returns the recorded boards by size, e.g. '4x4'."""
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def benchmarks(grids, depth=2):
+    """Returns the benchmarked functions by name, each running once over
+    `grids`.
+
+    The boards are restored after each move, so every call does the same
+    work, and the caches are cleared before each player call, so that
+    memoized evaluations are computed rather than looked up.
+    """
+    player_ai = PlayerAI()
+    player_ai.set_deadline(math.inf)
+
+    def run_merge():
+        for grid in grids:
+            for row in grid.grid:
+                Grid.merge(row)
+
+    def run_move(direction):
+        def run():
+            for grid in grids:
+                undo = grid.make_move(direction)
+                if undo is not None:
+                    grid.unmake(undo)
+        return run
+
+    def run_method(name):
+        def run():
+            for grid in grids:
+                getattr(grid, name)()
+        return run
+
+    def run_player(name):
+        def run():
+            for grid in grids:
+                player_ai.caches.clear()
+                getattr(player_ai, name)(grid)
+        return run
+
+    def run_maximize():
+        for grid in grids:
+            player_ai.table.clear()
+            player_ai.caches.clear()
+            player_ai.root_depth = depth
+            player_ai.maximize(grid, -math.inf, math.inf, depth)
+
+    functions = {'merge': run_merge}
+    for direction, name in zip(DIRECTIONS, DIRECTION_NAMES):
+        functions[f'move_{name}'] = run_move(direction)
+    for name in ('can_move', 'get_available_cells', 'clone'):
+        functions[name] = run_method(name)
+    for name in ('_evaluate', '_children_min', '_children_max'):
+        functions[name.lstrip('_')] = run_player(name)
+    functions[f'maximize_depth_{depth}'] = run_maximize
+    return functions
+
+
+def measure(func, repeat=5):
+    """Returns the best time of one call of `func` over `repeat` runs."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run(corpus, engine='grid', depth=2, repeat=5, names=None):
+    """Returns the time of each benchmark per board, by size and name."""
+    results = {}
+    for size, boards in corpus.items():
+        grids = [ENGINES[engine](grid=board) for board in boards]
+        for name, func in benchmarks(grids, depth).items():
+            if names and name not in names:
+                continue
+            results[f'{engine}/{size}/{name}'] = (
+                measure(func, repeat) / len(grids))
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """Returns the benchmarks slower than the baseline by more than
+    `threshold`, as (name, baseline time, time).
+    """
+    return [
+        (name, baseline[name], value) for name, value in results.items()
+        if name in baseline and value > baseline[name] * (1 + threshold)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time the board and search hot paths on recorded '
+                    'boards and compare them with a baseline.')
+    parser.add_argument('--engine', choices=ENGINES, default='grid')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='depth of the maximize benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-k', '--names', nargs='+', default=None,
+                        help='benchmarks to run, all by default')
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--record-corpus', action='store_true',
+                        help='play games to record the corpus and exit')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown relative to the baseline flagged '
+                             'as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.record_corpus:
+        with open(args.corpus, 'w', encoding='utf-8') as file:
+            json.dump(record_corpus(), file)
+            file.write('\n')
+        return 0
+    results = run(
+        load_corpus(args.corpus), args.engine, args.depth, args.repeat,
+        args.names)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    for name, value in results.items():
+        change = (
+            f'{value / baseline[name] - 1:+8.1%}' if name in baseline else '')
+        print(f'{name:40} {value * 1e6:12.2f} us {change}')
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({**baseline, **results}, file, indent=2)
+            file.write('\n')
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print(f'regression: {name} {before * 1e6:.2f} us -> '
+              f'{after * 1e6:.2f} us', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,350 @@
+from functools import lru_cache
+
+from grid import DIRECTIONS, DOWN, LEFT, RIGHT, Grid, symmetries
+
+SIZE_BITS = 16
+
+
+def to_exponent(value):
+    """Returns the log2 exponent of a tile value, 0 for an empty cell."""
+    return value.bit_length() - 1 if value else 0
+
+
+def to_value(exponent):
+    """Returns the tile value of a log2 exponent, 0 for an empty cell."""
+    return 1 << exponent if exponent else 0
+
+
+class MoveTable(dict):
+    """Maps a packed line to the packed line after merging towards index 0
+    (`reverse=False`) or towards the last index (`reverse=True`), with cell
+    `i` of the result at offset `i * stride`, by default `i * bits`.
+
+    A stride spreads the result of a column of the transposed board back
+    into a column of the board, so vertical moves also take one lookup per
+    line.
+
+    Entries missing from the table are computed with `Grid.merge` and
+    stored on first use. A merge giving a tile too large for `bits` bits
+    raises ValueError, as `BitGrid.set_tile` does, and is not stored.
+    """
+    def __init__(self, length, bits, reverse=False, stride=None):
+        super().__init__()
+        self.length = length
+        self.bits = bits
+        self.reverse = reverse
+        self.stride = bits if stride is None else stride
+        self.mask = (1 << bits) - 1
+
+    def __missing__(self, line):
+        values = [
+            to_value((line >> (i * self.bits)) & self.mask)
+            for i in range(self.length)]
+        if self.reverse:
+            values.reverse()
+        merged = Grid.merge(values)
+        if self.reverse:
+            merged.reverse()
+        result = 0
+        for i, value in enumerate(merged):
+            exponent = to_exponent(value)
+            if exponent > self.mask:
+                raise ValueError(
+                    f'Tile {value} does not fit in {self.bits} bits.')
+            result |= exponent << (i * self.stride)
+        self[line] = result
+        return result
+
+    def precompute(self):
+        """Fills the table for every line whose merge fits in `bits` bits.
+        """
+        for line in range(1 << (self.length * self.bits)):
+            try:
+                self[line]  # pylint: disable=pointless-statement
+            except ValueError:
+                pass
+        return self
+
+
+@lru_cache(maxsize=None)
+def move_tables(length, bits, stride=None):
+    """Returns the (towards start, towards end) move tables of a line.
+
+    Tables of lines of at most 16 bits (65536 entries) are filled eagerly,
+    the others are filled lazily since they can be huge.
+    """
+    tables = (
+        MoveTable(length, bits, stride=stride),
+        MoveTable(length, bits, reverse=True, stride=stride))
+    if length * bits <= 16:
+        for table in tables:
+            table.precompute()
+    return tables
+
+
+class TransformTable(dict):
+    """Maps a packed row to the row reversed, and to the column of the
+    transposed board holding the row and the reversed row, i.e. with cell
+    `i` moved to offset `i * stride`.
+
+    Entries are computed and stored on first use.
+    """
+    def __init__(self, length, bits, stride):
+        super().__init__()
+        self.length = length
+        self.bits = bits
+        self.stride = stride
+        self.mask = (1 << bits) - 1
+
+    def __missing__(self, line):
+        cells = [
+            (line >> (i * self.bits)) & self.mask for i in range(self.length)]
+        reversed_line = spread = spread_reversed = 0
+        for i, cell in enumerate(cells):
+            j = self.length - 1 - i
+            reversed_line |= cell << (j * self.bits)
+            spread |= cell << (i * self.stride)
+            spread_reversed |= cell << (j * self.stride)
+        entry = self[line] = (reversed_line, spread, spread_reversed)
+        return entry
+
+
+class LineTable(dict):
+    """Maps a packed line to its tile values and the indices of its empty
+    cells, computed and stored on first use.
+    """
+    def __init__(self, length, bits):
+        super().__init__()
+        self.length = length
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+
+    def __missing__(self, line):
+        values = tuple(
+            to_value((line >> (i * self.bits)) & self.mask)
+            for i in range(self.length))
+        entry = self[line] = (
+            values, tuple(i for i, value in enumerate(values) if not value))
+        return entry
+
+
+@lru_cache(maxsize=None)
+def line_table(length, bits):
+    """Returns the `LineTable` of lines of `length` cells."""
+    return LineTable(length, bits)
+
+
+def default_bits(height, width):
+    """Returns the bits per cell holding the largest tile a board of this
+    size can reach, 2 to the power of its number of cells plus 1, with at
+    least 4 bits.
+    """
+    return max(4, (height * width + 1).bit_length())
+
+
+@lru_cache(maxsize=None)
+def transform_table(height, width, bits):
+    """Returns the `TransformTable` of the rows of a board."""
+    return TransformTable(width, bits, height * bits)
+
+
+class BitGrid(Grid):
+    """Board packed into a single integer of log2 tile exponents.
+
+    Cell (row, col) occupies `bits` bits at offset
+    `(row * width + col) * bits`. Cells default to the bits of the
+    largest tile reachable on the board, see `default_bits`, e.g. 5 bits
+    on 4x4 and 5x5 boards. Moves are computed by looking up each row, or
+    each column of the transposed board, in move tables.
+
+    Moves and clones are several times faster than with `Grid`, but the
+    search as a whole is about as fast, since its time goes mostly to the
+    evaluation and ordering of the children.
+
+    Attributes:
+        board: The packed board.
+        bits: Number of bits per cell.
+        size_key: Height, width and bits packed into `SIZE_BITS` bits,
+            for boards smaller than 64x64.
+        rng: Random number generator of the spawned tiles, the `random`
+            module if None.
+    """
+    # pylint: disable=super-init-not-called
+    def __init__(self, height=4, width=4, grid=None, bits=None, rng=None):
+        if grid is not None:
+            height = len(grid)
+            width = len(grid[0])
+        self.height = height
+        self.width = width
+        self.rng = rng
+        if bits is None:
+            bits = default_bits(height, width)
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.size_key = (height << 10) | (width << 4) | bits
+        self.board = 0
+        # Builds the tables up front rather than during the first search.
+        move_tables(width, bits)
+        move_tables(height, bits, width * bits)
+        if grid is not None:
+            for row in range(height):
+                for col in range(width):
+                    self.set_tile(row, col, grid[row][col])
+
+    @property
+    def grid(self):
+        table = line_table(self.width, self.bits)
+        return [list(table[line][0]) for line in self.rows()]
+
+    def rows(self):
+        """Returns the packed rows."""
+        board = self.board
+        row_bits = self.width * self.bits
+        row_mask = (1 << row_bits) - 1
+        return [
+            (board >> (row * row_bits)) & row_mask
+            for row in range(self.height)]
+
+    def transposed(self):
+        """Returns the packed board transposed, whose rows are the columns
+        of the board.
+        """
+        table = transform_table(self.height, self.width, self.bits)
+        board = 0
+        for row, line in enumerate(self.rows()):
+            board |= table[line][1] << (row * self.bits)
+        return board
+
+    def columns(self):
+        """Returns the packed columns."""
+        board = self.transposed()
+        column_bits = self.height * self.bits
+        column_mask = (1 << column_bits) - 1
+        return [
+            (board >> (col * column_bits)) & column_mask
+            for col in range(self.width)]
+
+    @property
+    def hash(self):
+        """The packed board above the size, a unique key of the state
+        across board sizes.
+        """
+        return (self.board << SIZE_BITS) | self.size_key
+
+    def canonical(self):
+        """Returns the key of the least packed board under the symmetries,
+        as `hash`, and the transform giving it, see `grid.symmetries`.
+        """
+        table = transform_table(self.height, self.width, self.bits)
+        row_bits = self.width * self.bits
+        row_mask = (1 << row_bits) - 1
+        entries = []
+        for row in range(self.height):
+            line = (self.board >> (row * row_bits)) & row_mask
+            entries.append((line, *table[line]))
+        best = None
+        for transform in symmetries(self.height, self.width):
+            rows = entries[::-1] if transform & 2 else entries
+            if transform & 4:
+                index = 3 if transform & 1 else 2
+                shift = self.bits
+            else:
+                index = 1 if transform & 1 else 0
+                shift = row_bits
+            board = 0
+            for i, entry in enumerate(rows):
+                board |= entry[index] << (i * shift)
+            if best is None or board < best[0]:
+                best = board, transform
+        return (best[0] << SIZE_BITS) | self.size_key, best[1]
+
+    def clone(self):
+        other = BitGrid.__new__(BitGrid)
+        other.__dict__.update(self.__dict__)
+        return other
+
+    def _offset(self, row, col):
+        return (row * self.width + col) * self.bits
+
+    def get_tile(self, row, col):
+        return to_value((self.board >> self._offset(row, col)) & self.mask)
+
+    def set_tile(self, row, col, value):
+        exponent = to_exponent(value)
+        if exponent > self.mask:
+            raise ValueError(
+                f'Tile {value} does not fit in {self.bits} bits.')
+        offset = self._offset(row, col)
+        self.board = (
+            self.board & ~(self.mask << offset) | (exponent << offset))
+
+    def get_available_cells(self):
+        table = line_table(self.width, self.bits)
+        return [
+            (row, col) for row, line in enumerate(self.rows())
+            for col in table[line][1]]
+
+    def get_max_tile(self):
+        max_exponent = 0
+        board = self.board
+        while board:
+            max_exponent = max(max_exponent, board & self.mask)
+            board >>= self.bits
+        return to_value(max_exponent)
+
+    def moved_board(self, direction):
+        """Returns the packed board after moving in `direction`."""
+        board = self.board
+        result = 0
+        if direction in (LEFT, RIGHT):
+            table = move_tables(self.width, self.bits)[direction == RIGHT]
+            row_bits = self.width * self.bits
+            row_mask = (1 << row_bits) - 1
+            for row in range(self.height):
+                shift = row * row_bits
+                result |= table[(board >> shift) & row_mask] << shift
+        else:
+            table = move_tables(
+                self.height, self.bits, self.width * self.bits)[
+                    direction == DOWN]
+            for col, line in enumerate(self.columns()):
+                result |= table[line] << (col * self.bits)
+        return result
+
+    def move(self, direction):
+        result = self.moved_board(direction)
+        change = result != self.board
+        self.board = result
+        return change
+
+    def make_move(self, direction):
+        result = self.moved_board(direction)
+        if result == self.board:
+            return None
+        undo = self.board
+        self.board = result
+        return undo
+
+    def make_tile(self, row, col, value):
+        undo = self.board
+        self.set_tile(row, col, value)
+        return undo
+
+    def unmake(self, undo):
+        self.board = undo
+
+    def changes(self, direction):
+        return self.moved_board(direction) != self.board
+
+    def moved(self, direction):
+        result = self.moved_board(direction)
+        if result == self.board:
+            return None
+        child = self.clone()
+        child.board = result
+        return child
+
+    def can_move(self, dirs=DIRECTIONS):
+        if self.get_available_cells():
+            return True
+        return any(self.changes(dir_) for dir_ in dirs)
@@ -0,0 +1,117 @@
+import random
+from abc import abstractmethod
+from typing import Tuple
+
+from minimax import Minimax
+
+
+class Expectimax(Minimax):
+    """General expectimax algorithm with iterative deepening.
+
+    Chance nodes average their children weighted by probability instead of
+    assuming the worst one.
+
+    Attributes:
+        probability_cutoff: Chance nodes reached with a lower cumulative
+            probability are evaluated instead of expanded.
+        sample_depth: Ply from which chance nodes are sampled.
+        sample_size: Max number of outcomes expanded at a sampled chance
+            node.
+        seed: Seed of the sampling, reset at every move.
+        root_values: Values of the root children at the last depth.
+    """
+    profiled = {**Minimax.profiled, '_children_chance': 'children_chance'}
+
+    def __init__(
+            self, time_limit, probability_cutoff=1e-3,
+            sample_depth=4, sample_size=6, seed=0, **kwargs):
+        super().__init__(time_limit, **kwargs)
+        self.probability_cutoff = probability_cutoff
+        self.sample_depth = sample_depth
+        self.sample_size = sample_size
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.root_values = []
+
+    @abstractmethod
+    def _children_chance(self, state):
+        pass
+
+    @Minimax.memoize
+    def children_chance(self, state) -> Tuple[Tuple[float, object], ...]:
+        """Returns the tuple of (probability, move) of chance node.
+        Calls methods implemented in the subclass.
+        """
+        return self._children_chance(state)
+
+    def sample(self, outcomes):
+        """Returns the most probable `sample_size` outcomes, ties broken at
+        random, with probabilities renormalized.
+        """
+        outcomes = list(outcomes)
+        self.rng.shuffle(outcomes)
+        outcomes.sort(key=lambda outcome: outcome[0], reverse=True)
+        outcomes = outcomes[:self.sample_size]
+        total = sum(probability for probability, _ in outcomes)
+        return [(probability / total, move) for probability, move in outcomes]
+
+    def expect(self, state, depth, probability):
+        """Returns the expected heuristic value of chance node."""
+        self.timeout()
+        self.nodes += 1
+        if (self.terminal_test(state, depth)
+                or probability < self.probability_cutoff):
+            return self.evaluate(state)
+        outcomes = self.children_chance(state)
+        if self.root_depth - depth >= self.sample_depth:
+            outcomes = self.sample(outcomes)
+        utility = 0
+        for child_probability, move in outcomes:
+            undo = self.make(state, move)
+            try:
+                _, child_utility = self.expect_max(
+                    state, depth - 1, probability * child_probability)
+            finally:
+                self.unmake(state, undo)
+            utility += child_probability * child_utility
+        return utility
+
+    def expect_max(self, state, depth, probability):
+        """Returns the best child index and the heuristic value for
+        maximizing player.
+        """
+        self.timeout()
+        self.nodes += 1
+        if self.terminal_test(state, depth):
+            return None, self.evaluate(state)
+        max_index, max_utility = None, float('-inf')
+        values = []
+        for index, move in enumerate(self.children_max(state)):
+            undo = self.make(state, move)
+            try:
+                utility = self.expect(state, depth - 1, probability)
+            finally:
+                self.unmake(state, undo)
+            values.append(utility)
+            if utility > max_utility:
+                max_index, max_utility = index, utility
+        if depth == self.root_depth:
+            self.root_values = values
+        return max_index, max_utility
+
+    def search(
+            self, state, depth, alpha=float('-inf'), beta=float('inf')):
+        self.root_depth = depth
+        return self.expect_max(state, depth, 1.0)
+
+    def root_margin(self, state, index, value, depth):
+        others = [v for i, v in enumerate(self.root_values) if i != index]
+        return value - max(others, default=float('-inf')), True
+
+    def search_reply(self, state, depth):
+        self.root_depth = depth + 1
+        return self.expect(state, depth, 1.0)
+
+    def deepen(self, state, stats=None):
+        self.rng.seed(self.seed)
+        return super().deepen(state, stats)
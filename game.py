@@ -1,7 +1,14 @@
+import argparse
+import queue
+import threading
+import time
 import tkinter as tk
 
+from game_trace import TraceWriter
 from grid import DIRECTIONS, Grid
+from move_client import MoveClient
 from player_ai import PlayerAI
+from time_manager import TimeManager
 
 TILE_SIZE = 100
 BORDER_SIZE = 45
@@ -20,18 +27,50 @@ TEXT_COLOR = {
 
 
 class Game:
+    """Tk GUI of 2048, played by the AI or by the arrow keys.
+
+    The AI searches a copy of the board in a background thread and the
+    move is applied on the Tk main loop, which polls for it. Only the tiles
+    that changed are redrawn.
+
+    Attributes:
+        verbose: If True, the boards and moves are printed to the console.
+        ponder: If True, the AI keeps searching the spawned tiles after its
+            move until the next search starts.
+        adaptive: If True, the time limit is the average time of a move
+            rather than the time of every move.
+        trace: If set, every game played is appended to this binary trace
+            file, see `game_trace`.
+        server: If set, the moves are searched by the `move_server` at
+            this address, 'unix:PATH' or 'HOST:PORT', instead of in this
+            process.
+    """
     # pylint: disable=too-many-instance-attributes
-    def __init__(self):
+    def __init__(self, verbose=False, ponder=True, adaptive=False,
+                 trace=None, server=None):
+        self.verbose = verbose
+        self.ponder = ponder
+        self.adaptive = adaptive
+        self.trace = None if trace is None else TraceWriter(trace)
         self.height = 4
         self.width = 4
         self.time_limit = 0.1
         self.grid = Grid(height=self.height, width=self.width)
-        self.play_ai = PlayerAI(time_limit=self.time_limit)
+        self.play_ai = (
+            PlayerAI(time_limit=self.time_limit) if server is None
+            else MoveClient(server, self.time_limit))
         self.over = True
         self.human_mode = False
         self.directions = dict(zip(
             ('Up', 'Down', 'Left', 'Right'), DIRECTIONS))
         self.action = dict(zip(DIRECTIONS, ('Up', 'Down', 'Left', 'Right')))
+        self.results = queue.Queue()
+        self.searching = False
+        self.generation = 0
+        self.ponder_lock = threading.Lock()
+        self.shape = None
+        self.tiles = {}
+        self.drawn = {}
 
         self.root = tk.Tk()
         self.root.title('2048')
@@ -56,6 +95,13 @@ class Game:
         self.entry3.insert(0, str(self.time_limit))
         self.button2 = tk.Button(
             self.frame, text='Switch to human', command=self.switch_mode)
+        self.log_var = tk.BooleanVar(value=verbose)
+        self.check1 = tk.Checkbutton(
+            self.frame, text='Log to console', variable=self.log_var,
+            command=lambda: setattr(self, 'verbose', self.log_var.get()))
+        self.adaptive_var = tk.BooleanVar(value=adaptive)
+        self.check2 = tk.Checkbutton(
+            self.frame, text='Adaptive time', variable=self.adaptive_var)
         self.root.bind_all('<KeyPress>', self.human_move)
         self.frame.bind('<Button-1>', lambda e: e.widget.focus_set())
 
@@ -68,19 +114,26 @@ class Game:
         self.entry2.grid(row=2, column=1)
         self.entry3.grid(row=3, column=1)
         self.button2.grid(row=4, column=0, columnspan=2, padx=5, pady=5)
+        self.check1.grid(row=5, column=0, columnspan=2, padx=5, pady=5)
+        self.check2.grid(row=6, column=0, columnspan=2, padx=5)
         self.canvas.grid(row=0, column=1)
 
         self.draw()
         self.start_ai()
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.play_ai.close()
+            if self.trace is not None:
+                self.trace.close()
 
     def reset(self):
         self.height = int(self.entry1.get())
         self.width = int(self.entry2.get())
-        self.time_limit = float(self.entry3.get())
         self.grid = Grid(height=self.height, width=self.width)
-        self.play_ai.set_time_limit(self.time_limit)
+        self.set_time_limit()
         self.over = False
+        self.new_generation()
 
         self.canvas.config(
             width=self.width*TILE_SIZE + 2*BORDER_SIZE,
@@ -88,84 +141,202 @@ class Game:
 
         for _ in range(2):
             self.grid.insert_random_tile()
-        print("New game:")
-        print(self.grid)
+        if self.trace is not None:
+            self.trace.start_game(self.height, self.width)
+        self.log("New game:", self.grid, sep='\n')
         self.draw()
 
-    def draw(self):
+    def set_time_limit(self):
+        """Applies the time limit entered, as the average time of a move
+        if adaptive.
+        """
+        self.time_limit = float(self.entry3.get())
+        self.adaptive = self.adaptive_var.get()
+        self.play_ai.set_time_limit(self.time_limit)
+        self.play_ai.time_manager = (
+            TimeManager(self.time_limit * 100, 100) if self.adaptive
+            else None)
+
+    def log(self, *args, **kwargs):
+        """Prints to the console if `verbose`."""
+        if self.verbose:
+            print(*args, **kwargs)
+
+    def create_tiles(self):
+        """Creates the canvas items of every tile, drawn empty."""
         self.canvas.delete(tk.ALL)
+        self.shape = (self.height, self.width)
+        self.tiles = {}
+        self.drawn = {}
         for row in range(self.height):
             for col in range(self.width):
-                tile_value = self.grid.get_tile(row, col)
-                self.canvas.create_rectangle(
+                rectangle = self.canvas.create_rectangle(
                     col*TILE_SIZE + BORDER_SIZE,
                     row*TILE_SIZE + BORDER_SIZE,
                     (col+1)*TILE_SIZE + BORDER_SIZE,
                     (row+1)*TILE_SIZE + BORDER_SIZE,
                     width=TILE_SIZE // 10,
                     outline='#A39480',
-                    fill=TILE_COLOR[tile_value])
-                self.canvas.create_text(
+                    fill=TILE_COLOR[0])
+                text = self.canvas.create_text(
                     (col+0.5)*TILE_SIZE + BORDER_SIZE,
                     (row+0.5)*TILE_SIZE + BORDER_SIZE,
-                    text=str(tile_value),
-                    fill=TEXT_COLOR[tile_value],
+                    text='0',
+                    fill=TEXT_COLOR[0],
                     font=('Microsoft Sans Serif', -TILE_SIZE // 3, 'bold'))
+                self.tiles[row, col] = rectangle, text
+                self.drawn[row, col] = 0
+
+    def draw(self):
+        """Updates the canvas items of the tiles that changed."""
+        if self.shape != (self.height, self.width):
+            self.create_tiles()
+        for row in range(self.height):
+            for col in range(self.width):
+                tile_value = self.grid.get_tile(row, col)
+                if self.drawn[row, col] == tile_value:
+                    continue
+                rectangle, text = self.tiles[row, col]
+                self.canvas.itemconfigure(
+                    rectangle, fill=TILE_COLOR[tile_value])
+                self.canvas.itemconfigure(
+                    text, text=str(tile_value), fill=TEXT_COLOR[tile_value])
+                self.drawn[row, col] = tile_value
+
+    def search(self, grid, generation):
+        """Searches the move of `grid` and queues it with `generation`, then
+        ponders the board after the move unless the search is stale. Runs
+        in a background thread.
+        """
+        move = None
+        depth = 0
+        elapsed = 0.0
+        start = time.perf_counter()
+        try:
+            move = self.play_ai.get_move(grid)
+            depth = self.play_ai.depth - 1
+            elapsed = time.perf_counter() - start
+            with self.ponder_lock:
+                if (self.ponder and generation == self.generation
+                        and move is not None and grid.move(move)):
+                    self.play_ai.start_pondering(grid)
+        finally:
+            self.results.put((generation, move, depth, elapsed))
+
+    def new_generation(self):
+        """Marks the running search as stale and stops pondering, so that
+        a stale search does not start pondering afterwards.
+        """
+        with self.ponder_lock:
+            self.generation += 1
+            self.play_ai.stop_pondering()
 
     def start_ai(self):
-        if not self.human_mode and not self.over:
-            grid_copy = self.grid.clone()
-            print("Player's turn (AI):")
-            move = self.play_ai.get_move(grid_copy)
-            if move in DIRECTIONS:
-                if self.grid.can_move([move]):
-                    print(self.action[move])
-                    self.grid.move(move)
-                else:
-                    print("Invalid player AI move!")
-                    self.over = True
+        """Starts the search of the AI move if none is running, and
+        applies the moves found. Polls itself on the Tk main loop.
+        """
+        while not self.results.empty():
+            generation, move, depth, elapsed = self.results.get()
+            self.searching = False
+            if (generation == self.generation
+                    and not self.human_mode and not self.over):
+                self.apply_ai_move(move, depth, elapsed)
+        if not self.human_mode and not self.over and not self.searching:
+            self.searching = True
+            self.log("Player's turn (AI):")
+            threading.Thread(
+                target=self.search, args=(self.grid.clone(), self.generation),
+                daemon=True).start()
+        self.root.after(10, self.start_ai)
+
+    def apply_ai_move(self, move, depth=0, elapsed=0.0):
+        before = self.grid.clone()
+        if move in DIRECTIONS:
+            if self.grid.move(move):
+                self.log(self.action[move])
             else:
-                print("Invalid player AI move!!")
+                self.log("Invalid player AI move!")
                 self.over = True
-            if not self.over:
-                print(self.grid)
-                self.draw()
-                print("Computer's turn:")
-                self.grid.insert_random_tile()
-                print(self.grid)
-                self.draw()
-            if not self.grid.can_move():
-                self.over = True
-                print("Game over:", self.grid.get_max_tile(), '\n')
-        self.root.after(10, self.start_ai)
+        else:
+            self.log("Invalid player AI move!!")
+            self.over = True
+        if not self.over:
+            self.log(self.grid)
+            self.log("Computer's turn:")
+            spawn = self.grid.insert_random_tile()
+            self.record(before, move, spawn, depth, elapsed)
+            self.log(self.grid)
+            self.draw()
+        if not self.grid.can_move():
+            self.over = True
+            self.log("Game over:", self.grid.get_max_tile(), '\n')
+        if self.over:
+            self.play_ai.stop_pondering()
+            self.end_trace()
 
     def switch_mode(self):
         self.human_mode = not self.human_mode
+        self.new_generation()
         if self.human_mode:
             self.button2.config(text='Switch to AI')
         else:
             self.button2.config(text='Switch to human')
-            self.time_limit = float(self.entry3.get())
-            self.play_ai.set_time_limit(self.time_limit)
+            self.set_time_limit()
 
     def human_move(self, event):
         if (self.human_mode
                 and not self.over
                 and event.keysym in self.directions):
             move = self.directions[event.keysym]
+            before = self.grid.clone()
             if self.grid.move(move):
-                print("Player's turn:")
-                print(self.action[move])
-                print(self.grid)
-                self.draw()
-                print("Computer's turn:")
-                self.grid.insert_random_tile()
-                print(self.grid)
+                self.log("Player's turn:")
+                self.log(self.action[move])
+                self.log(self.grid)
+                self.log("Computer's turn:")
+                spawn = self.grid.insert_random_tile()
+                self.record(before, move, spawn)
+                self.log(self.grid)
                 self.draw()
                 if not self.grid.can_move():
                     self.over = True
-                    print("Game over:", self.grid.get_max_tile(), '\n')
+                    self.log("Game over:", self.grid.get_max_tile(), '\n')
+                    self.end_trace()
+
+    def record(self, grid, move, spawn, depth=0, elapsed=0.0):
+        """Appends a move of the game to the trace file if any."""
+        if self.trace is not None and self.trace.header is not None:
+            self.trace.record(grid, move, spawn, depth, elapsed)
+
+    def end_trace(self):
+        """Ends the game in the trace file if any."""
+        if self.trace is not None and self.trace.header is not None:
+            self.trace.end_game(self.grid)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Play 2048 in a Tk window, moved by the AI or by the '
+                    'arrow keys.')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the boards and moves to the console')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='use the time limit as the average time of a '
+                             'move')
+    parser.add_argument('--trace', default=None,
+                        help='binary file every game is appended to, see '
+                             'game_trace.py')
+    parser.add_argument('--server', default=None,
+                        help="address of a move_server searching the moves, "
+                             "'unix:PATH' or 'HOST:PORT'")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    Game(verbose=args.verbose, adaptive=args.adaptive, trace=args.trace,
+         server=args.server)
 
 
 if __name__ == '__main__':
-    game = Game()
+    main()
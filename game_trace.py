@@ -0,0 +1,207 @@
+import glob
+import mmap
+import os
+import struct
+from typing import NamedTuple
+
+from bitboard import to_exponent, to_value
+
+MAGIC = b'2048'
+GAME_HEADER = struct.Struct('<4sBBBxQI')
+RECORD = struct.Struct('<BBBBf')
+NO_MOVE = NO_CELL = 0xFF
+UNKNOWN_COUNT = 0xFFFFFFFF
+BITS = 5
+
+
+class GameHeader(NamedTuple):
+    """Header of a recorded game.
+
+    Attributes:
+        height: Number of rows.
+        width: Number of columns.
+        bits: Number of bits per cell of the packed boards.
+        seed: Seed of the spawned tiles, 0 if unknown.
+        count: Number of records.
+    """
+    height: int
+    width: int
+    bits: int
+    seed: int
+    count: int
+
+    @property
+    def board_size(self):
+        """Number of bytes of a packed board."""
+        return -(-self.height * self.width * self.bits // 8)
+
+
+class TraceRecord(NamedTuple):
+    """Position of a recorded game.
+
+    Attributes:
+        game: Header of the game.
+        index: Number of the game in the file.
+        board: Board before the move, packed into log2 exponents of
+            `game.bits` bits, cell (row, col) at offset
+            `(row * width + col) * bits`.
+        move: Move played, None for the final position.
+        spawn: Cell (row, col) of the tile spawned after the move, or None.
+        spawn_value: Value of the spawned tile, 0 if none.
+        depth: Depth completed by the search, 0 for a human move.
+        time: Time of the move.
+    """
+    game: GameHeader
+    index: int
+    board: int
+    move: object
+    spawn: object
+    spawn_value: int
+    depth: int
+    time: float
+
+    def rows(self):
+        """Returns the board as lists of tile values."""
+        mask = (1 << self.game.bits) - 1
+        return [
+            [to_value(
+                (self.board >> ((row * self.game.width + col)
+                                * self.game.bits)) & mask)
+             for col in range(self.game.width)]
+            for row in range(self.game.height)]
+
+
+def pack_board(grid, bits=BITS):
+    """Returns the tiles of `grid` packed into log2 exponents."""
+    board = 0
+    offset = 0
+    for row in grid.grid:
+        for value in row:
+            board |= to_exponent(value) << offset
+            offset += bits
+    return board
+
+
+class TraceWriter:
+    """Appends games to a binary trace file as a game header followed by
+    fixed-size records, so that files can be concatenated.
+
+    Attributes:
+        path: Path of the trace file.
+        bits: Number of bits per cell of the packed boards.
+        header: Header of the game being recorded, or None.
+    """
+    def __init__(self, path, bits=BITS):
+        self.path = path
+        self.bits = bits
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        self.file.seek(0, os.SEEK_END)
+        self.header = None
+        self.header_offset = 0
+
+    def start_game(self, height, width, seed=0):
+        """Starts a game, ending the previous one if any."""
+        if self.header is not None:
+            self.end_game()
+        self.header = GameHeader(height, width, self.bits, seed, 0)
+        self.header_offset = self.file.tell()
+        self.file.write(GAME_HEADER.pack(
+            MAGIC, height, width, self.bits, seed, UNKNOWN_COUNT))
+
+    def record(self, grid, move=None, spawn=None, depth=0, time=0.0):
+        """Records the board before a move.
+
+        Args:
+            grid: Board before the move.
+            move: Move played, None for the final position.
+            spawn: ((row, col), value) of the tile spawned after the move,
+                or None.
+            depth: Depth completed by the search.
+            time: Time of the move.
+        """
+        header = self.header
+        if spawn is None:
+            cell, exponent = NO_CELL, 0
+        else:
+            (row, col), value = spawn
+            cell, exponent = row * header.width + col, to_exponent(value)
+        self.file.write(
+            pack_board(grid, self.bits).to_bytes(header.board_size, 'little'))
+        self.file.write(RECORD.pack(
+            NO_MOVE if move is None else move, cell, exponent,
+            min(depth, 255), time))
+        self.header = header._replace(count=header.count + 1)
+
+    def end_game(self, grid=None):
+        """Records the final board if given and writes the record count."""
+        if grid is not None:
+            self.record(grid)
+        end = self.file.tell()
+        self.file.seek(self.header_offset + GAME_HEADER.size - 4)
+        self.file.write(struct.pack('<I', self.header.count))
+        self.file.seek(end)
+        self.file.flush()
+        self.header = None
+
+    def close(self):
+        if self.header is not None:
+            self.end_game()
+        self.file.close()
+
+
+def iter_records(path):
+    """Yields the `TraceRecord` of every position of a trace file, read
+    through a memory map so that files larger than memory can be scanned.
+
+    A game whose count was never written, by a writer that did not end it,
+    extends to the end of the file.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offset = 0
+        index = 0
+        while offset + GAME_HEADER.size <= len(data):
+            magic, height, width, bits, seed, count = GAME_HEADER.unpack_from(
+                data, offset)
+            if magic != MAGIC:
+                raise ValueError(f'{path}: no game header at {offset}.')
+            offset += GAME_HEADER.size
+            header = GameHeader(height, width, bits, seed, count)
+            size = header.board_size + RECORD.size
+            if count == UNKNOWN_COUNT:
+                count = (len(data) - offset) // size
+                header = header._replace(count=count)
+            for _ in range(count):
+                board = int.from_bytes(
+                    data[offset:offset + header.board_size], 'little')
+                move, cell, exponent, depth, time = RECORD.unpack_from(
+                    data, offset + header.board_size)
+                yield TraceRecord(
+                    header, index, board,
+                    None if move == NO_MOVE else move,
+                    None if cell == NO_CELL else divmod(cell, width),
+                    to_value(exponent), depth, time)
+                offset += size
+            index += 1
+
+
+def trace_path(path):
+    """Returns the trace file of `path` owned by this process."""
+    return f'{path}.{os.getpid()}.part'
+
+
+def merge_traces(path):
+    """Appends the trace files of all processes to `path` and deletes them.
+    """
+    parts = glob.glob(f'{glob.escape(path)}.*.part')
+    with open(path, 'ab') as file:
+        for part in parts:
+            with open(part, 'rb') as source:
+                while True:
+                    chunk = source.read(1 << 20)
+                    if not chunk:
+                        break
+                    file.write(chunk)
+            os.remove(part)
@@ -1,11 +1,125 @@
 import random
+from functools import lru_cache
 
 DIRECTIONS = (UP, DOWN, LEFT, RIGHT) = range(4)
 OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+ZOBRIST_SEED = 2048
+MAX_EXPONENT = 32
+KEY_MASK = (1 << 64) - 1
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(height, width):
+    """Returns the random 64-bit keys of each cell indexed by
+    `tile.bit_length()`, with 0 for an empty cell.
+
+    The keys are seeded so that hashes are identical across processes.
+    """
+    rng = random.Random(f'{ZOBRIST_SEED}:{height}x{width}')
+    return tuple(
+        tuple(
+            (0,) + tuple(rng.getrandbits(64) for _ in range(MAX_EXPONENT))
+            for _ in range(width))
+        for _ in range(height))
+
+
+@lru_cache(maxsize=None)
+def symmetries(height, width):
+    """Returns the transforms mapping a board of this size onto itself.
+
+    A transform is an int whose bits flip the columns (1), flip the rows
+    (2) and transpose (4), applied in this order. Square boards have 8
+    transforms, rectangular boards the 4 without transposition.
+    """
+    return tuple(range(8 if height == width else 4))
+
+
+def transform_cell(transform, row, col, height, width):
+    """Returns the cell that (row, col) is mapped to by `transform`."""
+    if transform & 2:
+        row = height - 1 - row
+    if transform & 1:
+        col = width - 1 - col
+    if transform & 4:
+        row, col = col, row
+    return row, col
+
+
+def transform_direction(transform, direction):
+    """Returns the direction that `direction` is mapped to by
+    `transform`.
+    """
+    d_row, d_col = OFFSETS[direction]
+    if transform & 2:
+        d_row = -d_row
+    if transform & 1:
+        d_col = -d_col
+    if transform & 4:
+        d_row, d_col = d_col, d_row
+    return OFFSETS.index((d_row, d_col))
+
+
+def inverse_transform(transform):
+    """Returns the transform undoing `transform`."""
+    if transform & 4:
+        return 4 | (transform & 1) << 1 | (transform & 2) >> 1
+    return transform
+
+
+@lru_cache(maxsize=None)
+def symmetric_zobrist(height, width):
+    """Returns the keys of each cell indexed like `zobrist_table`, which
+    pack the 64-bit key of the cell under each transform, such that the
+    XOR of the keys over the tiles packs the hash of every transformed
+    board.
+    """
+    zobrist = zobrist_table(height, width)
+    table = []
+    for row in range(height):
+        table.append([])
+        for col in range(width):
+            keys = [0] * (MAX_EXPONENT + 1)
+            for transform in symmetries(height, width):
+                r, c = transform_cell(transform, row, col, height, width)
+                for index, key in enumerate(zobrist[r][c]):
+                    keys[index] |= key << (64 * transform)
+            table[-1].append(tuple(keys))
+    return tuple(tuple(row) for row in table)
+
+
+@lru_cache(maxsize=None)
+def line_indices(height, width, direction):
+    """Returns the cells of each line, ordered in the direction the tiles
+    move to.
+    """
+    if direction == UP:
+        return tuple(
+            tuple((row, col) for row in range(height))
+            for col in range(width))
+    if direction == DOWN:
+        return tuple(
+            tuple((row, col) for row in range(height - 1, -1, -1))
+            for col in range(width))
+    if direction == LEFT:
+        return tuple(
+            tuple((row, col) for col in range(width))
+            for row in range(height))
+    return tuple(
+        tuple((row, col) for col in range(width - 1, -1, -1))
+        for row in range(height))
 
 
 class Grid:
-    def __init__(self, height=4, width=4, grid=None):
+    """The 2048 board.
+
+    Attributes:
+        rng: Random number generator of the spawned tiles, the `random`
+            module if None.
+        symmetric_hash: Hashes of the board under each transform packed
+            in 64-bit fields, kept up to date once `canonical` is called,
+            else None.
+    """
+    def __init__(self, height=4, width=4, grid=None, rng=None):
         if grid is None:
             self.height = height
             self.width = width
@@ -16,20 +130,64 @@ class Grid:
             self.grid = [
                 [grid[row][col] for col in range(self.width)]
                 for row in range(self.height)]
+        self.rng = rng
+        self.zobrist = zobrist_table(self.height, self.width)
+        self.hash = 0
+        for row in range(self.height):
+            for col in range(self.width):
+                self.hash ^= self.zobrist[row][col][
+                    self.grid[row][col].bit_length()]
+        self.symmetric_keys = None
+        self.symmetric_hash = None
 
     def __str__(self):
         return ('\n'.join(
             [''.join([f'{cell:6}' for cell in row]) for row in self.grid]))
 
     def clone(self):
-        return Grid(grid=self.grid)
+        other = Grid.__new__(Grid)
+        other.height = self.height
+        other.width = self.width
+        other.grid = [row[:] for row in self.grid]
+        other.rng = self.rng
+        other.zobrist = self.zobrist
+        other.hash = self.hash
+        other.symmetric_keys = self.symmetric_keys
+        other.symmetric_hash = self.symmetric_hash
+        return other
 
     def get_tile(self, row, col):
         return self.grid[row][col]
 
     def set_tile(self, row, col, value):
+        keys = self.zobrist[row][col]
+        self.hash ^= (
+            keys[self.grid[row][col].bit_length()] ^ keys[value.bit_length()])
+        if self.symmetric_hash is not None:
+            keys = self.symmetric_keys[row][col]
+            self.symmetric_hash ^= (
+                keys[self.grid[row][col].bit_length()]
+                ^ keys[value.bit_length()])
         self.grid[row][col] = value
 
+    def canonical(self):
+        """Returns the least hash of the board under its symmetries and the
+        transform giving it, which maps the board onto the representative
+        shared by all its symmetric boards.
+        """
+        if self.symmetric_hash is None:
+            self.symmetric_keys = symmetric_zobrist(self.height, self.width)
+            self.symmetric_hash = 0
+            for row in range(self.height):
+                for col in range(self.width):
+                    self.symmetric_hash ^= self.symmetric_keys[row][col][
+                        self.grid[row][col].bit_length()]
+        hashes = [
+            (self.symmetric_hash >> (64 * transform)) & KEY_MASK
+            for transform in symmetries(self.height, self.width)]
+        key = min(hashes)
+        return key, hashes.index(key)
+
     def get_available_cells(self):
         cells = []
         for row in range(self.height):
@@ -61,41 +219,77 @@ class Grid:
         return result
 
     def move(self, direction):
-        if direction == UP:
-            index_lists = [
-                [(row, col) for row in range(self.height)]
-                for col in range(self.width)]
-        elif direction == DOWN:
-            index_lists = [
-                [(row, col) for row in range(self.height - 1, -1, -1)]
-                for col in range(self.width)]
-        elif direction == LEFT:
-            index_lists = [
-                [(row, col) for col in range(self.width)]
-                for row in range(self.height)]
-        elif direction == RIGHT:
-            index_lists = [
-                [(row, col) for col in range(self.width - 1, -1, -1)]
-                for row in range(self.height)]
-        change = False
-        for index_list in index_lists:
+        return self.make_move(direction) is not None
+
+    def make_move(self, direction):
+        """Moves in `direction`.
+
+        Returns:
+            The record to undo the move with `unmake`, or None if the move
+            changes nothing.
+        """
+        undo = []
+        for index_list in line_indices(self.height, self.width, direction):
             before = [self.grid[row][col] for (row, col) in index_list]
             after = self.merge(before)
             if after != before:
-                change = True
-                for (row, col), value in zip(index_list, after):
-                    self.set_tile(row, col, value)
-        return change
+                for (row, col), old, value in zip(index_list, before, after):
+                    if value != old:
+                        undo.append((row, col, old))
+                        self.set_tile(row, col, value)
+        return undo or None
+
+    def make_tile(self, row, col, value):
+        """Sets a tile and returns the record to undo it with `unmake`."""
+        undo = [(row, col, self.grid[row][col])]
+        self.set_tile(row, col, value)
+        return undo
+
+    def unmake(self, undo):
+        """Restores the tiles changed by `make_move` or `make_tile`."""
+        for row, col, old in reversed(undo):
+            self.set_tile(row, col, old)
+
+    def changes(self, direction):
+        """Returns True if moving in `direction` changes the grid."""
+        for index_list in line_indices(self.height, self.width, direction):
+            previous = 0
+            gap = False
+            for row, col in index_list:
+                tile = self.grid[row][col]
+                if tile == 0:
+                    gap = True
+                elif gap or tile == previous:
+                    return True
+                else:
+                    previous = tile
+        return False
+
+    def moved(self, direction):
+        """Returns a copy of the grid moved in `direction`, or None if the
+        move changes nothing.
+        """
+        if not self.changes(direction):
+            return None
+        child = self.clone()
+        child.move(direction)
+        return child
 
     def insert_random_tile(self):
-        if random.random() < 0.9:
+        """Spawns a 2 or a 4 on a random empty cell and returns
+        ((row, col), value), or None if the board is full.
+        """
+        rng = random if self.rng is None else self.rng
+        if rng.random() < 0.9:
             tile_value = 2
         else:
             tile_value = 4
         cells = self.get_available_cells()
         if cells:
-            row, col = random.choice(cells)
+            row, col = rng.choice(cells)
             self.set_tile(row, col, tile_value)
+            return (row, col), tile_value
+        return None
 
     def cross_bound(self, row, col):
         return row < 0 or row >= self.height or col < 0 or col >= self.width
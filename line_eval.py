@@ -0,0 +1,138 @@
+import math
+from itertools import chain
+from typing import NamedTuple, Tuple
+
+from bitboard import BitGrid, to_value
+from grid import Grid
+
+
+class LineScore(NamedTuple):
+    """Contribution of a row or column to the evaluation score.
+
+    Attributes:
+        score: Weighted adjacent difference, potential merging and ordering
+            terms, which add up over rows and columns.
+        empty: Number of empty cells.
+        log_sum: Sum of the log2 tile values.
+        log_max: Max log2 tile value.
+        logs: Sorted log2 values of the tiles.
+    """
+    score: float
+    empty: int
+    log_sum: float
+    log_max: float
+    logs: Tuple[float, ...]
+
+
+class PackedScoreTable(dict):
+    """Maps a packed `BitGrid` line to its `LineScore`, looked up in the
+    tables of a `LineEvaluator` on first use.
+    """
+    def __init__(self, evaluator, length, bits):
+        super().__init__()
+        self.evaluator = evaluator
+        self.length = length
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+
+    def __missing__(self, line):
+        entry = self[line] = self.evaluator.lookup(tuple(
+            to_value((line >> (i * self.bits)) & self.mask)
+            for i in range(self.length)))
+        return entry
+
+
+class LineEvaluator:
+    """Evaluates a board as the sum of the scores of its rows and columns,
+    looked up in tables indexed by the line content and filled on first use.
+
+    Gives the same score as `PlayerAI.evaluate_board`, whose terms only
+    depend on single lines, except the average, median and max tile which
+    are combined from the per-line sums, sorted tiles and maxima.
+
+    Attributes:
+        weights: Weights of the heuristic terms.
+        reference: If set, every score is checked against this function.
+        lines: Table of tuples of tile values.
+        packed_lines: `PackedScoreTable` of packed `BitGrid` lines by
+            (length, bits).
+    """
+    def __init__(self, weights, reference=None):
+        self.weights = weights
+        self.reference = reference
+        self.lines = {}
+        self.packed_lines = {}
+
+    def line_score(self, values):
+        """Returns the `LineScore` of a line of tile values."""
+        logs = [math.log(x, 2) if x != 0 else 0 for x in values]
+        pairs = list(zip(logs, logs[1:]))
+        diff = sum(abs(a - b) for a, b in pairs)
+        merging = sum(1 for a, b in pairs if a != 0 and a == b)
+        if all(a >= b for a, b in pairs) or all(a <= b for a, b in pairs):
+            ordering = max(logs)
+        else:
+            ordering = -max(logs)
+        return LineScore(
+            score=(
+                self.weights[4] * diff
+                + self.weights[5] * merging
+                + self.weights[6] * ordering),
+            empty=logs.count(0),
+            log_sum=sum(logs),
+            log_max=max(logs),
+            logs=tuple(sorted(x for x in logs if x != 0)))
+
+    def lookup(self, line):
+        """Returns the `LineScore` of a tuple of tile values."""
+        try:
+            return self.lines[line]
+        except KeyError:
+            entry = self.lines[line] = self.line_score(line)
+            return entry
+
+    def packed_table(self, length, bits):
+        """Returns the `PackedScoreTable` of packed lines of `length`
+        cells.
+        """
+        try:
+            return self.packed_lines[length, bits]
+        except KeyError:
+            table = self.packed_lines[length, bits] = PackedScoreTable(
+                self, length, bits)
+            return table
+
+    def line_scores(self, grid: Grid):
+        """Returns the `LineScore` of each row and of each column."""
+        if not isinstance(grid, BitGrid):
+            return (
+                [self.lookup(tuple(row)) for row in grid.grid],
+                [self.lookup(column) for column in zip(*grid.grid)])
+        row_table = self.packed_table(grid.width, grid.bits)
+        column_table = self.packed_table(grid.height, grid.bits)
+        return (
+            [row_table[line] for line in grid.rows()],
+            [column_table[line] for line in grid.columns()])
+
+    def evaluate(self, grid: Grid):
+        """Returns the evaluation score of the grid."""
+        weights = self.weights
+        rows, columns = self.line_scores(grid)
+        empty = sum(row.empty for row in rows)
+        tiles = sorted(chain.from_iterable(row.logs for row in rows))
+        score = (
+            sum(line.score for line in rows)
+            + sum(line.score for line in columns)
+            + weights[0] * empty
+            + weights[1] * (
+                sum(row.log_sum for row in rows)
+                / (grid.height * grid.width - empty))
+            + weights[2] * tiles[len(tiles) // 2]
+            + weights[3] * max(row.log_max for row in rows))
+        if self.reference is not None:
+            expected = self.reference(grid)
+            if not math.isclose(score, expected, abs_tol=1e-9):
+                raise RuntimeError(
+                    f'Line tables score {score}, expected {expected}:\n'
+                    f'{grid}')
+        return score
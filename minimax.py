@@ -1,40 +1,190 @@
+import copy
+import math
+import threading
 import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from functools import wraps
-from heapq import heappop
-from typing import Any, Callable, List, Tuple, Union
+from typing import Any, Callable, Tuple
+
+from stats import Profiler, SearchStats
+from transposition import EXACT, LOWER, UPPER, LRUCache, TranspositionTable
+
+_MISSING = object()
+
+
+class SearchTimeout(Exception):
+    """Raised when the search reaches its deadline."""
 
 
 @dataclass(order=True)
 class PrioritizedItem:
     priority: float
-    state: Any = field(compare=False)
+    move: Any = field(compare=False)
 
 
 class Minimax(ABC):
     """General minimax algorithm with alpha-beta pruning.
 
+    The search applies moves to a single state with `make` and reverts
+    them with `unmake`, so children are represented by their moves.
+
     Attributes:
-        time_limit: Time limit of each move.
-        order: If True, will use heap to order nodes.
-        cache: If True, will cache the evaluation score and children.
+        time_limit: Time limit of each move, or None for no time limit.
+        max_depth: If set, the deepest depth searched.
+        max_nodes: If set, the max number of nodes visited per move. Unlike
+            the time limit, depth and node budgets give the same move and
+            node count on any machine.
+        check_interval: Number of calls of `timeout` between clock checks.
+        soft_deadline: If True, will not start a depth predicted to end
+            after the time limit.
+        order: If True, will sort nodes by evaluation score.
+        cache: If True, will cache the evaluation score and children, and
+            store search results in a transposition table.
+        cache_size: Max number of items of each function cache.
+        table: Transposition table, kept across moves.
+        caches: Function caches by function name, kept across moves.
+        killers: If True, will try first at min nodes the moves that caused
+            a cutoff at the same ply.
+        history: If True, will order the other children of min nodes by
+            the depth-weighted count of cutoffs they caused.
+        aspiration: Half width of the window around the value of the
+            previous depth searched first, or None for a full window.
+        stage_size: Number of children of min nodes searched in the cheap
+            order of `children_min` before the others are evaluated and
+            sorted.
+        pv: Best child index of the nodes on the principal variation of
+            the previous depth, by node key.
         depth: Depth of iterative deepening search.
+        nodes: Number of nodes visited during the last move.
+        cutoffs: Number of alpha-beta cutoffs during the last move.
+        stats_hook: If set, is called with the `SearchStats` of every move.
+        persistent: If set, a `PersistentCache` whose move is played when
+            searched at least `persistent_depth` deep, and where every
+            searched root is recorded, by `canonical` key. Keys must be
+            stable across processes.
+        persistent_depth: Min depth of the moves played from `persistent`.
+        ponder_nodes: Number of nodes visited by the last pondering.
+        pondered: Whether the table was aged for a pondering that the next
+            search continues, keeping the age of its entries.
+        time_manager: If set, a `TimeManager` allocating the time of each
+            move instead of `time_limit`.
     """
-    def __init__(self, time_limit, order=True, cache=True):
+    # Methods timed when collecting statistics, by the name reported.
+    profiled = {
+        '_evaluate': 'evaluate', '_evaluate_batch': 'evaluate',
+        '_children_min': 'children_min', '_children_max': 'children_max'}
+
+    def __init__(
+            self, time_limit, order=True, cache=True,
+            cache_size=1 << 16, table_size=1 << 16,
+            check_interval=64, soft_deadline=False,
+            killers=True, history=True, aspiration=None,
+            max_depth=None, max_nodes=None, stage_size=2):
+        if time_limit is None and max_depth is None and max_nodes is None:
+            raise ValueError('The search needs a time, depth or node budget.')
         self.time_limit = time_limit
-        self.time_start = time.time()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.check_interval = check_interval
+        self.soft_deadline = soft_deadline
+        self.time_start = time.monotonic()
+        self.deadline = self.time_start + self.time_budget()
+        self.countdown = check_interval
         self.order = order
         self.cache = cache
+        self.cache_size = cache_size
+        self.table = TranspositionTable(table_size)
+        self.caches = {}
+        self.killers = killers
+        self.history = history
+        self.aspiration = aspiration
+        self.stage_size = stage_size
+        self.killer_moves = {}
+        self.history_scores = {}
+        self.pv = {}
+        self.root_depth = 0
         self.depth = 0
+        self.nodes = 0
+        self.cutoffs = 0
+        self.stats_hook = None
+        self.persistent = None
+        self.persistent_depth = 0
+        self.ponder_thread = None
+        self.ponder_nodes = 0
+        self.pondered = False
+        self.time_manager = None
 
     def set_time_limit(self, time_limit):
         """Sets time limit."""
         self.time_limit = time_limit
 
+    def time_budget(self):
+        """Returns the time limit, infinite if there is none."""
+        return math.inf if self.time_limit is None else self.time_limit
+
+    def close(self):
+        """Releases the resources held by the search."""
+        self.stop_pondering()
+
+    def set_deadline(self, deadline):
+        """Sets the `time.monotonic` time at which the search stops."""
+        self.deadline = deadline
+        self.countdown = 0
+
     def timeout(self):
-        """Raises `AssertionError` if time out."""
-        assert time.time() - self.time_start <= self.time_limit
+        """Raises `SearchTimeout` if time out or the node budget is spent.
+        The clock is only read every `check_interval` calls.
+        """
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.check_interval
+            if time.monotonic() >= self.deadline:
+                raise SearchTimeout
+
+    def can_finish(self, durations):
+        """Returns False if the next depth is predicted to end after the
+        deadline, growing as much as the last depth did from the one before.
+        """
+        if len(durations) < 2:
+            return True
+        growth = max(durations[-1] / max(durations[-2], 1e-9), 1.0)
+        return time.monotonic() + durations[-1] * growth <= self.deadline
+
+    def urgency(self, state):
+        """Returns the scale of the time share of the move at `state`."""
+        return 1.0
+
+    def root_margin(self, state, index, value, depth):
+        """Returns `value` of the best child `index` minus the best value
+        of the other children searched to `depth`, from the transposition
+        table, and whether it is exact rather than a lower bound.
+
+        Returns:
+            The margin and whether it is exact, or None and False if a
+            value is missing.
+        """
+        bound = float('-inf')
+        exact = True
+        for i, move in enumerate(self.root_children(state)):
+            if i == index:
+                continue
+            undo = self.make(state, move)
+            entry = self.table.peek(self.node_key(state, False))
+            self.unmake(state, undo)
+            if (entry is None or entry.flag == LOWER
+                    or entry.depth < depth - 1):
+                return None, False
+            bound = max(bound, entry.value)
+            exact = exact and entry.flag == EXACT
+        return value - bound, exact
+
+    def record_time(self):
+        """Charges the time of the move to the time manager if any."""
+        if self.time_manager is not None:
+            self.time_manager.record(time.monotonic() - self.time_start)
 
     @abstractmethod
     def terminal_test(self, state, depth):
@@ -44,26 +194,72 @@ class Minimax(ABC):
     def hashkey(self, state):
         """Returns a hasable key of the state to be used in function cache."""
 
+    def node_key(self, state, maximizing):
+        """Returns the key of the state in the transposition table, which
+        tells max nodes from min nodes since the same state can be both.
+        """
+        return self.hashkey(state), maximizing
+
+    def canonical(self, state):
+        """Returns the key of the state in the function caches, and the
+        transform mapping it to the representative of its symmetric states,
+        or None if symmetries are not used.
+        """
+        return self.hashkey(state), None
+
+    def transform_value(self, state, name, value, transform, inverse=False):
+        """Returns the value of function `name` at `state` mapped through
+        `transform`, or through its inverse to map a value of the
+        representative back to `state`.
+        """
+        return value
+
     # pylint: disable=no-self-argument
     def memoize(func: Callable):
         """Returns a decorator that stores the value `func` returns regarding
-        its parameter `state`.
+        its parameter `state` in a bounded cache of the instance.
+
+        Symmetric states share the value of their representative, see
+        `canonical`.
         """
-        func.cache = {}
+        name = func.__name__
 
         @wraps(func)
         def wrapper(self, state):
             # pylint: disable=not-callable
-            if self.cache:
-                key = self.hashkey(state)
-                if key not in func.cache:
-                    func.cache[key] = func(self, state)
-                value = func.cache[key]
-            else:
+            if not self.cache:
+                return func(self, state)
+            cache = self.get_cache(name)
+            key, transform = self.canonical(state)
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
                 value = func(self, state)
-            return value
+                cache.put(key, self.transform_value(
+                    state, name, value, transform))
+                return value
+            return self.transform_value(
+                state, name, value, transform, inverse=True)
         return wrapper
 
+    def get_cache(self, name):
+        """Returns the cache of function `name`, created if missing."""
+        try:
+            return self.caches[name]
+        except KeyError:
+            cache = self.caches[name] = LRUCache(self.cache_size)
+            return cache
+
+    def cache_info(self):
+        """Returns the hit, miss and eviction counters of the transposition
+        table and of each function cache.
+        """
+        caches = {'table': self.table, **self.caches}
+        return {
+            name: {
+                'size': len(cache), 'hits': cache.hits,
+                'misses': cache.misses, 'evictions': cache.evictions}
+            for name, cache in caches.items()}
+
     @abstractmethod
     def _evaluate(self, state):
         pass
@@ -75,99 +271,491 @@ class Minimax(ABC):
         """
         return self._evaluate(state)
 
+    def _evaluate_batch(self, states):
+        return [self._evaluate(state) for state in states]
+
+    def batch_evaluation(self, count):
+        """Returns True if `count` children are to be evaluated in a single
+        call of `_evaluate_batch` on snapshots instead of one by one.
+        """
+        return False
+
+    def snapshot(self, state):
+        """Returns an independent copy of the state, a deep copy unless
+        the subclass knows a cheaper one.
+        """
+        return copy.deepcopy(state)
+
+    def evaluate_children(self, state, moves):
+        """Returns the evaluation scores of the children reached by moves,
+        computing the uncached ones in a single call of `_evaluate_batch`
+        if `batch_evaluation` allows it.
+        """
+        if not self.batch_evaluation(len(moves)):
+            scores = []
+            for move in moves:
+                undo = self.make(state, move)
+                scores.append(self.evaluate(state))
+                self.unmake(state, undo)
+            return scores
+        cache = self.get_cache('evaluate') if self.cache else None
+        scores = [None] * len(moves)
+        keys, snapshots, missing = [], [], []
+        for i, move in enumerate(moves):
+            undo = self.make(state, move)
+            key = self.canonical(state)[0] if cache is not None else None
+            score = _MISSING if cache is None else cache.get(key, _MISSING)
+            if score is _MISSING:
+                keys.append(key)
+                snapshots.append(self.snapshot(state))
+                missing.append(i)
+            else:
+                scores[i] = score
+            self.unmake(state, undo)
+        if missing:
+            computed = self._evaluate_batch(snapshots)
+            for i, key, score in zip(missing, keys, computed):
+                scores[i] = score
+                if cache is not None:
+                    cache.put(key, score)
+        return scores
+
+    @abstractmethod
+    def make(self, state, move):
+        """Applies the move to the state and returns the record to undo it.
+        """
+
+    @abstractmethod
+    def unmake(self, state, undo):
+        """Reverts the move recorded by `undo`."""
+
+    def sort_children(self, children) -> Tuple[Any, ...]:
+        """Returns the moves of `PrioritizedItem` children in the order to
+        be searched.
+        """
+        if self.order:
+            children = sorted(children)
+        else:
+            children = reversed(children)
+        return tuple(item.move for item in children)
+
     @abstractmethod
     def _children_min(self, state):
         pass
 
     @memoize
-    def children_min(self, state) -> Union[tuple, Tuple[PrioritizedItem, ...]]:
-        """Returns the tuple or heap of children nodes of min node.
+    def children_min(self, state) -> Tuple[Any, ...]:
+        """Returns the tuple of moves of min node in a cheap order,
+        refined by evaluation in `search_order`.
         Calls methods implemented in the subclass.
         """
-        return self._children_min(state)
+        return self.sort_children(self._children_min(state))
 
     @abstractmethod
     def _children_max(self, state):
         pass
 
     @memoize
-    def children_max(self, state) -> Union[tuple, Tuple[PrioritizedItem, ...]]:
-        """Returns the tuple or heap of children nodes of max node.
+    def children_max(self, state) -> Tuple[Any, ...]:
+        """Returns the tuple of moves of max node in search order.
         Calls methods implemented in the subclass.
         """
-        return self._children_max(state)
+        return self.sort_children(self._children_max(state))
 
-    def pop_children(self, children: Union[list, List[PrioritizedItem]]):
-        """Pops a child from the children list"""
-        if self.order:
-            state = heappop(children).state
+    def probe(self, state, alpha, beta, depth, maximizing):
+        """Looks up the transposition table for a max or min node.
+
+        Returns:
+            The key of the state, the best child index stored for it, and
+            the stored value if it decides the node or else None, followed
+            by the narrowed alpha and beta.
+        """
+        if not self.cache:
+            return None, None, None, alpha, beta
+        key = self.node_key(state, maximizing)
+        entry = self.table.probe(key)
+        best = self.pv.get(key)
+        if entry is None:
+            return key, best, None, alpha, beta
+        if best is None:
+            best = entry.best
+        if entry.depth >= depth:
+            if entry.flag == EXACT:
+                return key, entry.best, entry.value, alpha, beta
+            if entry.flag == LOWER:
+                alpha = max(alpha, entry.value)
+            else:
+                beta = min(beta, entry.value)
+            if alpha >= beta:
+                return key, entry.best, entry.value, alpha, beta
+        return key, best, None, alpha, beta
+
+    def store(self, key, depth, value, alpha, beta, best):
+        """Stores the result of a node searched with window (alpha, beta)."""
+        if key is None:
+            return
+        if value <= alpha:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
         else:
-            state = children.pop()
-        return state
+            flag = EXACT
+        self.table.store(key, depth, value, flag, best)
+
+    def search_order(self, children, best, ply=None, state=None):
+        """Returns the child indices in search order: the stored best
+        child, then at min nodes the killer moves of `ply` and the other
+        children by history score.
+
+        If the min node `state` is given, its children are expected in a
+        cheap order, and beyond the first `stage_size` of them they are
+        sorted by evaluation score only when the search reaches them.
+        """
+        first = []
+        if best is not None and best < len(children):
+            first.append(best)
+        staged = (
+            state is not None and self.order
+            and len(children) > len(first) + self.stage_size)
+        if ply is None or not (self.killers or self.history or staged):
+            if not first or best == 0:
+                return range(len(children))
+            return first + [i for i in range(len(children)) if i != best]
+        if self.killers:
+            killers = self.killer_moves.get(ply, ())
+            first.extend(
+                i for i, move in enumerate(children)
+                if move in killers and i != best)
+        rest = [i for i in range(len(children)) if i not in first]
+        if staged and len(rest) > self.stage_size:
+            return self.staged_order(state, children, first, rest)
+        self.sort_history(children, rest)
+        return first + rest
+
+    def sort_history(self, children, indices):
+        """Sorts child indices by history score if enabled."""
+        if self.history:
+            indices.sort(key=lambda i: -self.history_scores.get(
+                children[i], 0))
+
+    def staged_order(self, state, children, first, rest):
+        """Yields the indices `first`, then the first `stage_size` of
+        `rest`, then the others sorted by the evaluation score of the
+        child, computed once the search gets there. Each stage is sorted by
+        history score.
+        """
+        stage, rest = rest[:self.stage_size], rest[self.stage_size:]
+        self.sort_history(children, stage)
+        yield from first
+        yield from stage
+        scores = self.evaluate_children(state, [children[i] for i in rest])
+        rest = [i for _, i in sorted(zip(scores, rest))]
+        self.sort_history(children, rest)
+        yield from rest
+
+    def record_cutoff(self, move, ply, depth):
+        """Updates the killer moves and history scores of a min node."""
+        if self.killers:
+            killers = self.killer_moves.setdefault(ply, [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+        if self.history:
+            self.history_scores[move] = (
+                self.history_scores.get(move, 0) + depth * depth)
 
     def minimize(self, state, alpha, beta, depth):
-        """Returns the best child and the heuristic value for
+        """Returns the best child index and the heuristic value for
         minimizing player.
         """
         self.timeout()
+        self.nodes += 1
         if self.terminal_test(state, depth):
             return None, self.evaluate(state)
-        min_child, min_utility = None, float('inf')
-        children = list(self.children_min(state))
-        while len(children) > 0:
-            child = self.pop_children(children)
-            _, utility = self.maximize(child, alpha, beta, depth - 1)
+        key, best, value, alpha, beta = self.probe(
+            state, alpha, beta, depth, False)
+        if value is not None:
+            return best, value
+        alpha_orig, beta_orig = alpha, beta
+        min_index, min_utility = None, float('inf')
+        children = self.children_min(state)
+        ply = self.root_depth - depth
+        for index in self.search_order(children, best, ply, state):
+            undo = self.make(state, children[index])
+            try:
+                _, utility = self.maximize(state, alpha, beta, depth - 1)
+            finally:
+                self.unmake(state, undo)
             if utility < min_utility:
-                min_child, min_utility = child, utility
+                min_index, min_utility = index, utility
             if min_utility <= alpha:
+                self.cutoffs += 1
+                self.record_cutoff(children[index], ply, depth)
                 break
             if min_utility < beta:
                 beta = min_utility
-        return min_child, min_utility
+        self.store(key, depth, min_utility, alpha_orig, beta_orig, min_index)
+        return min_index, min_utility
 
     def maximize(self, state, alpha, beta, depth):
-        """Returns the best child and the heuristic value for
+        """Returns the best child index and the heuristic value for
         maximizing player.
         """
         self.timeout()
+        self.nodes += 1
         if self.terminal_test(state, depth):
             return None, self.evaluate(state)
-        max_child, max_utility = None, float('-inf')
-        children = list(self.children_max(state))
-        while len(children) > 0:
-            child = self.pop_children(children)
-            _, utility = self.minimize(child, alpha, beta, depth - 1)
+        key, best, value, alpha, beta = self.probe(
+            state, alpha, beta, depth, True)
+        if value is not None:
+            return best, value
+        alpha_orig, beta_orig = alpha, beta
+        max_index, max_utility = None, float('-inf')
+        children = self.children_max(state)
+        for index in self.search_order(children, best):
+            undo = self.make(state, children[index])
+            try:
+                _, utility = self.minimize(state, alpha, beta, depth - 1)
+            finally:
+                self.unmake(state, undo)
             if utility > max_utility:
-                max_child, max_utility = child, utility
+                max_index, max_utility = index, utility
             if max_utility >= beta:
+                self.cutoffs += 1
                 break
             if max_utility > alpha:
                 alpha = max_utility
-        return max_child, max_utility
+        self.store(key, depth, max_utility, alpha_orig, beta_orig, max_index)
+        return max_index, max_utility
 
-    @abstractmethod
-    def get_move_to_child(self, state, child):
-        """Returns the move from state to child state."""
+    def principal_variation(self, state, depth):
+        """Returns the best child index of the nodes on the principal
+        variation stored in the transposition table, by node key.
+        """
+        pv = {}
+        children_funcs = (self.children_max, self.children_min)
+        undos = []
+        try:
+            for ply in range(depth):
+                key = self.node_key(state, ply % 2 == 0)
+                entry = self.table.peek(key)
+                if entry is None or entry.best is None or key in pv:
+                    break
+                pv[key] = entry.best
+                children = children_funcs[ply % 2](state)
+                if entry.best >= len(children):
+                    break
+                undos.append(self.make(state, children[entry.best]))
+        finally:
+            for undo in reversed(undos):
+                self.unmake(state, undo)
+        return pv
+
+    def root_children(self, state):
+        """Returns `children_max(state)` without checking the deadline or
+        the node budget, which may be spent when the search is over.
+        """
+        max_nodes, deadline = self.max_nodes, self.deadline
+        self.max_nodes = None
+        self.set_deadline(math.inf)
+        try:
+            return self.children_max(state)
+        finally:
+            self.max_nodes = max_nodes
+            self.set_deadline(deadline)
+
+    def search(
+            self, state, depth, alpha=float('-inf'), beta=float('inf')):
+        """Returns the best child index and its value searched to `depth`
+        within the window (alpha, beta).
+        """
+        self.root_depth = depth
+        return self.maximize(state, alpha, beta, depth)
+
+    def search_reply(self, state, depth):
+        """Returns the value of the opponent node `state` searched to
+        `depth`.
+        """
+        self.root_depth = depth + 1
+        return self.minimize(
+            state, float('-inf'), float('inf'), depth)[1]
+
+    def start_pondering(self, state, time_limit=None):
+        """Searches the opponent node `state` in a background thread while
+        waiting for its reply, so that the next search finds the replies in
+        the caches and transposition table.
+
+        Args:
+            state: Node after the move, searched in place, so it should not
+                be used until `stop_pondering`.
+            time_limit: Max time of pondering, by default until
+                `stop_pondering`, which `get_move` calls.
+        """
+        self.stop_pondering()
+        self.set_deadline(
+            math.inf if time_limit is None
+            else time.monotonic() + time_limit)
+        self.nodes = 0
+        self.table.new_search()
+        self.pondered = True
+        self.ponder_thread = threading.Thread(
+            target=self.ponder, args=(state,), daemon=True)
+        self.ponder_thread.start()
+
+    def ponder(self, state):
+        """Searches the opponent node `state` by iterative deepening until
+        the deadline or a budget is reached.
+        """
+        depth = 0
+        while self.max_depth is None or depth < self.max_depth - 1:
+            depth += 1
+            if self.terminal_test(state, depth):
+                break
+            try:
+                self.search_reply(state, depth)
+            except SearchTimeout:
+                break
+        self.ponder_nodes = self.nodes
+
+    def stop_pondering(self):
+        """Stops pondering and waits for it to finish."""
+        if self.ponder_thread is None:
+            return
+        self.set_deadline(float('-inf'))
+        self.ponder_thread.join()
+        self.ponder_thread = None
 
-    def get_move(self, state):
-        """Returns the best move or None by iterative deepening."""
-        self.time_start = time.time()
-        child = None
+    def search_window(self, state, depth, value):
+        """Searches within the aspiration window around `value`, searching
+        again with a full window if the value falls outside of it.
+        """
+        if self.aspiration is None or value is None:
+            return self.search(state, depth)
+        alpha, beta = value - self.aspiration, value + self.aspiration
+        index, value = self.search(state, depth, alpha, beta)
+        if value <= alpha or value >= beta:
+            index, value = self.search(state, depth)
+        return index, value
+
+    def get_move(self, state, stats=False):
+        """Returns the best move or None by iterative deepening.
+
+        Statistics of the search are collected only if `stats` is True, in
+        which case the move and the `SearchStats` are returned, or if
+        `stats_hook` is set.
+        """
+        self.stop_pondering()
+        if not stats and self.stats_hook is None:
+            move = self.deepen(state)
+            self.record_time()
+            return move
+        search_stats = SearchStats()
+        profiler = Profiler()
+        for attr, name in self.profiled.items():
+            setattr(self, attr, profiler.wrap(name, getattr(self, attr)))
+        counters = self.cache_info()
+        try:
+            move = self.deepen(state, search_stats)
+        finally:
+            for attr in self.profiled:
+                vars(self).pop(attr, None)
+        self.record_time()
+        search_stats.time = time.monotonic() - self.time_start
+        search_stats.nodes = self.nodes
+        search_stats.cutoffs = self.cutoffs
+        search_stats.times = profiler.times
+        for name, info in self.cache_info().items():
+            before = counters.get(name, {'hits': 0, 'misses': 0})
+            hits = info['hits'] - before['hits']
+            misses = info['misses'] - before['misses']
+            search_stats.caches[name] = {
+                'hits': hits, 'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+        if self.stats_hook is not None:
+            self.stats_hook(search_stats)
+        if stats:
+            return move, search_stats
+        return move
+
+    def deepen(self, state, stats=None):
+        """Returns the best move or None by iterative deepening, recording
+        the nodes and cutoffs of each completed depth in `stats` if given.
+        """
+        self.time_start = time.monotonic()
+        self.set_deadline(self.time_start + self.time_budget())
+        self.nodes = 0
+        self.cutoffs = 0
+        # The entries of the pondering belong to this search.
+        if not self.pondered:
+            self.table.new_search()
+        self.pondered = False
+        if self.persistent is not None:
+            key, transform = self.canonical(state)
+            cached = self.persistent.get(key)
+            if cached is not None and cached.depth >= self.persistent_depth:
+                move, = self.transform_value(
+                    state, 'children_max', (cached.move,), transform,
+                    inverse=True)
+                if move in self.root_children(state):
+                    self.depth = cached.depth + 1
+                    if stats is not None:
+                        stats.depth = cached.depth
+                    return move
+        target = None
+        if self.time_manager is not None:
+            children = self.root_children(state)
+            if len(children) <= 1:
+                self.depth = 1
+                return children[0] if children else None
+            target, limit = self.time_manager.allocate(self.urgency(state))
+            self.set_deadline(self.time_start + limit)
+        index = value = move = None
         depth = 0
-        if self.cache:
-            # pylint: disable=no-member
-            self.evaluate.cache.clear()
-            self.children_min.cache.clear()
-            self.children_max.cache.clear()
+        durations = []
+        self.killer_moves.clear()
+        self.history_scores.clear()
+        self.pv = {}
         while True:
+            depth += 1
+            if self.max_depth is not None and depth > self.max_depth:
+                break
+            if self.soft_deadline and not self.can_finish(durations):
+                break
+            iteration_start = time.monotonic()
+            previous = index
+            try:
+                index, value = self.search_window(state, depth, value)
+            except SearchTimeout:
+                break
+            durations.append(time.monotonic() - iteration_start)
+            if index is not None:
+                move = self.root_children(state)[index]
+            if stats is not None:
+                stats.depth = depth
+                stats.nodes_per_depth.append(
+                    self.nodes - sum(stats.nodes_per_depth))
+                stats.cutoffs_per_depth.append(
+                    self.cutoffs - sum(stats.cutoffs_per_depth))
+            # The lookups of the principal variation may time out on cache
+            # misses, after the move of this depth is known.
             try:
+                if self.cache:
+                    self.pv = self.principal_variation(state, depth)
+                stop = target is not None and self.time_manager.should_stop(
+                    time.monotonic() - self.time_start, target,
+                    index != previous,
+                    *self.root_margin(state, index, value, depth))
+            except SearchTimeout:
+                stop = True
+            if stop:
                 depth += 1
-                child, _ = self.maximize(
-                    state, float('-inf'), float('inf'), depth)
-            except AssertionError:
                 break
-        if child is None:
+        if move is None:
             return None
         self.depth = depth
-        move = self.get_move_to_child(state, child)
+        if self.persistent is not None:
+            key, transform = self.canonical(state)
+            cached_move, = self.transform_value(
+                state, 'children_max', (move,), transform)
+            self.persistent.record(key, cached_move, value, depth - 1)
         return move
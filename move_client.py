@@ -0,0 +1,95 @@
+import json
+import socket
+import threading
+import time
+
+
+def connect(address):
+    """Returns a socket connected to 'unix:PATH' or 'HOST:PORT'."""
+    if address.startswith('unix:'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address[len('unix:'):])
+        return sock
+    host, _, port = address.rpartition(':')
+    return socket.create_connection((host or 'localhost', int(port)))
+
+
+class MoveClient:
+    """Client of a `move_server`, usable in place of `PlayerAI` to get the
+    moves of a board from a warm engine shared by many games.
+
+    Requests are JSON lines answered in order. The server does not
+    ponder, so `start_pondering` and `stop_pondering` do nothing.
+
+    Attributes:
+        address: Address of the server, 'unix:PATH' or 'HOST:PORT'.
+        time_limit: Time limit sent with each request, or None for the
+            default of the server.
+        time_manager: If set, the time limit of each move is allocated by
+            this `TimeManager` instead.
+        depth: Depth completed by the last search plus 1, as in `PlayerAI`.
+        nodes: Number of nodes visited by the last search.
+    """
+    def __init__(self, address, time_limit=None):
+        self.address = address
+        self.time_limit = time_limit
+        self.time_manager = None
+        self.depth = 0
+        self.nodes = 0
+        self.socket = connect(address)
+        self.file = self.socket.makefile('rwb')
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def request(self, message):
+        """Sends a request and returns the response.
+
+        Raises:
+            ConnectionError: The server closed the connection.
+            RuntimeError: The server could not answer the request.
+        """
+        with self.lock:
+            self.next_id += 1
+            message = {**message, 'id': self.next_id}
+            self.file.write(json.dumps(message).encode() + b'\n')
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError(f'{self.address} closed the connection.')
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def get_move(self, state):
+        """Returns the move of `state` searched by the server or None."""
+        time_limit = self.time_limit
+        if self.time_manager is not None:
+            time_limit, _ = self.time_manager.allocate()
+        start = time.monotonic()
+        response = self.request(
+            {'grid': state.grid, 'time_limit': time_limit})
+        if self.time_manager is not None:
+            self.time_manager.record(time.monotonic() - start)
+        self.depth = response['depth'] + 1
+        self.nodes = response['nodes']
+        return response['move']
+
+    def stats(self):
+        """Returns the statistics of the server."""
+        return self.request({'op': 'stats'})['stats']
+
+    def set_time_limit(self, time_limit):
+        """Sets time limit."""
+        self.time_limit = time_limit
+
+    def start_pondering(self, state, time_limit=None):
+        # pylint: disable=unused-argument
+        pass
+
+    def stop_pondering(self):
+        pass
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
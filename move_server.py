@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+from simulate import ENGINES, PLAYERS
+
+_worker_player = None
+
+
+def _init_worker(player, time_limit, max_depth):
+    # pylint: disable=global-statement
+    global _worker_player
+    _worker_player = PLAYERS[player](
+        time_limit=time_limit, max_depth=max_depth)
+
+
+def _search(rows, engine, time_limit):
+    """Returns the move of `rows`, the depth completed and the number of
+    nodes visited by the player of this worker.
+    """
+    player = _worker_player
+    player.set_time_limit(time_limit)
+    move = player.get_move(ENGINES[engine](grid=rows))
+    return move, player.depth - 1, player.nodes
+
+
+@dataclass
+class ServiceStats:
+    """Statistics of a move server since it started.
+
+    Attributes:
+        requests: Number of move requests received.
+        coalesced: Number of requests answered by the search of an
+            identical position already in flight.
+        searches: Number of searches completed.
+        queue_time: Total time searches waited for a worker.
+        max_queue_time: Longest time a search waited for a worker.
+        search_time: Total time of the searches.
+        uptime: Time since the server started.
+    """
+    requests: int = 0
+    coalesced: int = 0
+    searches: int = 0
+    queue_time: float = 0.0
+    max_queue_time: float = 0.0
+    search_time: float = 0.0
+    uptime: float = 0.0
+
+    def to_dict(self):
+        """Returns the statistics with mean latencies and throughput as a
+        JSON serializable dict.
+        """
+        searches = self.searches or 1
+        return {
+            **asdict(self),
+            'mean_queue_time': self.queue_time / searches,
+            'mean_search_time': self.search_time / searches,
+            'requests_per_sec': (
+                self.requests / self.uptime if self.uptime else 0.0),
+        }
+
+
+class MoveServer:
+    """Asyncio front end answering move requests with a pool of warm
+    players, one per worker process.
+
+    Requests are queued and dispatched to the first idle worker. A request
+    for a position already queued or being searched waits for that search
+    instead of starting another, whatever its time limit.
+
+    Attributes:
+        workers: Number of worker processes.
+        player: Name of the player in `simulate.PLAYERS`.
+        engine: Name of the board class in `simulate.ENGINES`.
+        time_limit: Time limit of the requests without one.
+        max_depth: Depth budget of every search.
+        stats: `ServiceStats` of the server.
+    """
+    def __init__(self, workers=1, player='minimax', engine='grid',
+                 time_limit=0.1, max_depth=None):
+        self.workers = workers
+        self.player = player
+        self.engine = engine
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.stats = ServiceStats()
+        self.executor = None
+        self.queue = None
+        self.in_flight = {}
+        self.dispatchers = []
+        self.connections = {}
+        self.start_time = 0.0
+
+    async def start(self):
+        """Starts the worker processes and the dispatchers."""
+        self.executor = ProcessPoolExecutor(
+            self.workers, initializer=_init_worker,
+            initargs=(self.player, self.time_limit, self.max_depth))
+        self.queue = asyncio.Queue()
+        self.start_time = time.monotonic()
+        self.dispatchers = [
+            asyncio.create_task(self.dispatch())
+            for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.dispatchers = []
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def get_move(self, rows, time_limit=None):
+        """Returns the move of the board `rows`, the depth completed and
+        the number of nodes visited.
+        """
+        self.stats.requests += 1
+        key = tuple(map(tuple, rows))
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[key] = future
+            self.queue.put_nowait((
+                key, rows, self.time_limit if time_limit is None
+                else time_limit, time.monotonic(), future))
+        else:
+            self.stats.coalesced += 1
+        return await asyncio.shield(future)
+
+    async def dispatch(self):
+        """Runs the queued searches on a worker, one at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            key, rows, time_limit, queued, future = await self.queue.get()
+            start = time.monotonic()
+            self.stats.queue_time += start - queued
+            self.stats.max_queue_time = max(
+                self.stats.max_queue_time, start - queued)
+            try:
+                result = await loop.run_in_executor(
+                    self.executor, _search, rows, self.engine, time_limit)
+            except Exception as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            finally:
+                del self.in_flight[key]
+                self.stats.searches += 1
+                self.stats.search_time += time.monotonic() - start
+
+    def report(self):
+        """Returns the statistics of the server as a dict."""
+        self.stats.uptime = time.monotonic() - self.start_time
+        return self.stats.to_dict()
+
+    async def answer(self, line):
+        """Returns the response to a request line."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if request.get('op', 'move') == 'stats':
+                return {'id': request_id, 'stats': self.report()}
+            move, depth, nodes = await self.get_move(
+                request['grid'], request.get('time_limit'))
+            return {'id': request_id, 'move': move, 'depth': depth,
+                    'nodes': nodes}
+        except Exception as error:  # pylint: disable=broad-except
+            return {'id': request_id, 'error': repr(error)}
+
+    async def handle(self, reader, writer):
+        """Answers the requests of a connection in order."""
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.answer(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    async def serve(self, address, report_interval=None):
+        """Serves requests on 'unix:PATH' or 'HOST:PORT' until cancelled,
+        printing the statistics every `report_interval` seconds if set.
+        """
+        if address.startswith('unix:'):
+            server = await asyncio.start_unix_server(
+                self.handle, address[len('unix:'):])
+        else:
+            host, _, port = address.rpartition(':')
+            server = await asyncio.start_server(
+                self.handle, host or 'localhost', int(port))
+        await self.start()
+        try:
+            async with server:
+                await server.start_serving()
+                while True:
+                    await asyncio.sleep(report_interval or 3600)
+                    if report_interval:
+                        print(json.dumps(self.report()), file=sys.stderr)
+        finally:
+            tasks = list(self.connections)
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.close()
+            print(json.dumps(self.report()), file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve the moves of boards sent as JSON lines by '
+                    'many games, with one warm player per worker.')
+    parser.add_argument('--address', default='localhost:2048',
+                        help="'unix:PATH' or 'HOST:PORT'")
+    parser.add_argument('-j', '--workers', type=int,
+                        default=os.cpu_count() or 1)
+    parser.add_argument('--player', choices=PLAYERS, default='minimax')
+    parser.add_argument('--engine', choices=ENGINES, default='grid')
+    parser.add_argument('--time-limit', type=float, default=0.1,
+                        help='seconds per move of the requests without '
+                             'a time limit')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='search depth per move')
+    parser.add_argument('--report', type=float, default=None,
+                        help='seconds between statistics printed to stderr')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = MoveServer(
+        args.workers, args.player, args.engine, args.time_limit,
+        args.max_depth)
+    try:
+        asyncio.run(server.serve(args.address, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
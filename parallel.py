@@ -0,0 +1,124 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from grid import Grid
+from minimax import SearchTimeout
+from player_ai import PlayerAI
+
+_worker_player = None
+
+
+def _init_worker(time_limit, options):
+    # pylint: disable=global-statement
+    global _worker_player
+    _worker_player = PlayerAI(time_limit, **options)
+
+
+def _search_child(rows, grid_class, deadline, max_depth=None):
+    """Searches the min node `rows` by iterative deepening until `deadline`
+    or `max_depth`.
+
+    Returns:
+        The values of the completed depths and the number of nodes visited.
+    """
+    player = _worker_player
+    player.set_deadline(deadline)
+    player.nodes = 0
+    player.table.new_search()
+    player.killer_moves.clear()
+    player.history_scores.clear()
+    child = grid_class(grid=rows)
+    values = []
+    depth = 0
+    while max_depth is None or depth < max_depth:
+        try:
+            depth += 1
+            player.root_depth = depth + 1
+            _, value = player.minimize(
+                child, float('-inf'), float('inf'), depth)
+        except SearchTimeout:
+            break
+        values.append(value)
+    return values, player.nodes
+
+
+class RootParallelAI(PlayerAI):
+    """Minimax for 2048 searching each root move in its own process.
+
+    Each worker keeps its own caches and transposition table across moves.
+    The move with the best value at the deepest depth completed for every
+    root move is played. Since there are at most 4 root moves, at most 4
+    workers are busy at a time, and with fewer workers the root moves are
+    searched in rounds sharing the time limit. A depth budget applies to
+    every root move. Node budgets, the time manager and the persistent
+    cache are not supported and raise ValueError, and the statistics only
+    hold the depth and nodes of the move. Other keyword arguments, such as
+    `symmetry`, are passed to the `PlayerAI` of every worker.
+
+    Attributes:
+        workers: Number of worker processes.
+        overhead: Time reserved for dispatching jobs and collecting
+            results.
+        options: Keyword arguments of the players of the workers.
+    """
+    def __init__(
+            self, time_limit=0.1, workers=None, overhead=0.01,
+            max_depth=None, max_nodes=None, **kwargs):
+        if max_nodes is not None:
+            raise ValueError('Root parallel search has no node budget.')
+        super().__init__(time_limit, max_depth=max_depth, **kwargs)
+        if workers is None:
+            workers = min(os.cpu_count() or 1, 4)
+        self.workers = workers
+        self.overhead = overhead
+        self.options = kwargs
+        self.executor = None
+
+    def close(self):
+        super().close()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def deepen(self, state: Grid, stats=None):
+        if self.time_manager is not None:
+            raise ValueError('Root parallel search has no time manager.')
+        if self.persistent is not None:
+            raise ValueError('Root parallel search has no persistent cache.')
+        self.time_start = time.monotonic()
+        self.nodes = 0
+        children = self.children_max(state)
+        if not children:
+            return None
+        if len(children) == 1:
+            self.depth = 1
+            return children[0]
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker,
+                initargs=(self.time_budget(), self.options))
+        # Root moves beyond the number of workers wait for a free worker,
+        # so each round of jobs gets an equal share of the time.
+        rounds = -(-len(children) // self.workers)
+        time_slice = (self.time_budget() - self.overhead) / rounds
+        child_depth = None if self.max_depth is None else self.max_depth - 1
+        futures = [
+            self.executor.submit(
+                _search_child, state.moved(move).grid, type(state),
+                self.time_start + (i // self.workers + 1) * time_slice,
+                child_depth)
+            for i, move in enumerate(children)]
+        results = [future.result() for future in futures]
+        self.nodes = sum(nodes for _, nodes in results)
+        depth = min(len(values) for values, _ in results)
+        if depth == 0:
+            index = 0
+        else:
+            index = max(
+                range(len(children)),
+                key=lambda i: results[i][0][depth - 1])
+        self.depth = depth + 2
+        if stats is not None:
+            stats.depth = depth + 1
+        return children[index]
@@ -0,0 +1,236 @@
+import glob
+import mmap
+import os
+import struct
+from typing import NamedTuple
+
+MAGIC = b'2048TT02'
+JOURNAL_MAGIC = b'2048TJ02'
+HEADER = struct.Struct('<8sQHH12s')
+RECORD = struct.Struct('<QdBB6x')
+KEY_MASK = (1 << 64) - 1
+
+
+def fold_key(key):
+    """Returns a nonzero 64-bit key, folding larger keys by XOR."""
+    while key >> 64:
+        key = (key & KEY_MASK) ^ (key >> 64)
+    return key or 1
+
+
+class CachedMove(NamedTuple):
+    move: int
+    value: float
+    depth: int
+
+
+class Geometry(NamedTuple):
+    height: int
+    width: int
+    engine: str
+
+
+def read_header(data, offset, magic, path):
+    """Returns the count and `Geometry` of the header at `offset`."""
+    found, count, height, width, engine = HEADER.unpack_from(data, offset)
+    if found != magic:
+        raise ValueError(f'{path} is not a position cache.')
+    return count, Geometry(height, width, engine.rstrip(b'\0').decode())
+
+
+def pack_header(magic, count, geometry):
+    return HEADER.pack(
+        magic, count, geometry.height, geometry.width,
+        geometry.engine.encode())
+
+
+def check_geometry(path, found, expected):
+    if found != expected:
+        raise ValueError(
+            f'{path} holds {found.height}x{found.width} {found.engine} '
+            f'positions, not {expected.height}x{expected.width} '
+            f'{expected.engine}.')
+
+
+class PersistentCache:
+    """Read-only memory-mapped table of searched positions, with writes
+    buffered in memory and saved to journals merged later by `merge`.
+
+    The file is a header (capacity, height, width, engine) followed by an
+    open addressing hash table of fixed-size records
+    (key, value, depth, move), with key 0 marking an empty slot. Since the
+    file is only read, any number of processes can share it. A file of
+    another board size or engine raises ValueError.
+
+    Attributes:
+        path: Path of the table file.
+        geometry: `Geometry` of the boards, e.g. (4, 4, 'grid').
+        capacity: Number of slots, 0 if the file does not exist.
+        pending: Searched positions to be saved, by key.
+    """
+    def __init__(self, path, height, width, engine):
+        self.path = path
+        self.geometry = Geometry(height, width, engine)
+        self.capacity = 0
+        self.mmap = None
+        self.pending = {}
+        if os.path.exists(path) and os.path.getsize(path) > HEADER.size:
+            with open(path, 'rb') as file:
+                self.mmap = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.capacity, geometry = read_header(
+                    self.mmap, 0, MAGIC, path)
+                check_geometry(path, geometry, self.geometry)
+            except ValueError:
+                self.close()
+                raise
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def get(self, key):
+        """Returns the `CachedMove` of `key` in the file or None."""
+        if not self.capacity:
+            return None
+        key = fold_key(key)
+        index = key & (self.capacity - 1)
+        for _ in range(self.capacity):
+            record = RECORD.unpack_from(
+                self.mmap, HEADER.size + index * RECORD.size)
+            if record[0] == 0:
+                return None
+            if record[0] == key:
+                return CachedMove(record[3], record[1], record[2])
+            index = (index + 1) & (self.capacity - 1)
+        return None
+
+    def items(self):
+        """Yields the (key, `CachedMove`) pairs stored in the file."""
+        for index in range(self.capacity):
+            key, value, depth, move = RECORD.unpack_from(
+                self.mmap, HEADER.size + index * RECORD.size)
+            if key:
+                yield key, CachedMove(move, value, depth)
+
+    def record(self, key, move, value, depth):
+        """Buffers a searched position, keeping the deepest search."""
+        key = fold_key(key)
+        cached = self.pending.get(key)
+        if cached is None or cached.depth <= depth:
+            self.pending[key] = CachedMove(move, value, min(depth, 255))
+
+    def write_journal(self, path):
+        """Appends the buffered positions to a journal file, after a
+        header of their count and geometry, and clears them.
+        """
+        with open(path, 'ab') as file:
+            file.write(pack_header(
+                JOURNAL_MAGIC, len(self.pending), self.geometry))
+            for key, cached in self.pending.items():
+                file.write(RECORD.pack(
+                    key, cached.value, cached.depth, cached.move))
+        self.pending.clear()
+
+
+def journal_path(path):
+    """Returns the journal file of `path` owned by this process."""
+    return f'{path}.{os.getpid()}.journal'
+
+
+def read_journal(path):
+    """Yields the (`Geometry`, key, `CachedMove`) of the positions of a
+    journal file.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        count, geometry = read_header(data, offset, JOURNAL_MAGIC, path)
+        offset += HEADER.size
+        for _ in range(count):
+            key, value, depth, move = RECORD.unpack_from(data, offset)
+            yield geometry, key, CachedMove(move, value, depth)
+            offset += RECORD.size
+
+
+def merge(path, journals, capacity=None):
+    """Merges journals into the table file at `path`, keeping the deepest
+    search of each position, and replaces the file atomically.
+
+    Args:
+        path: Path of the table file, created if missing.
+        journals: Paths of the journal files.
+        capacity: Number of slots, by default the smallest power of two
+            keeping the table at most half full.
+
+    Returns:
+        The number of positions in the new file.
+
+    Raises:
+        ValueError: The journals and the table file hold boards of
+            different sizes or engines.
+    """
+    entries = {}
+    geometry = None
+    if os.path.exists(path) and os.path.getsize(path) > HEADER.size:
+        with open(path, 'rb') as file:
+            _, geometry = read_header(
+                file.read(HEADER.size), 0, MAGIC, path)
+        cache = PersistentCache(path, *geometry)
+        for key, cached in cache.items():
+            entries[key] = cached
+        cache.close()
+    for journal in journals:
+        for found, key, cached in read_journal(journal):
+            if geometry is None:
+                geometry = found
+            check_geometry(journal, found, geometry)
+            if key not in entries or entries[key].depth <= cached.depth:
+                entries[key] = cached
+    if geometry is None:
+        return 0
+    if capacity is None:
+        capacity = 1024
+        while capacity < 2 * len(entries):
+            capacity *= 2
+    if capacity & (capacity - 1) or capacity < len(entries):
+        raise ValueError('Capacity must be a power of two above the size.')
+    slots = [None] * capacity
+    for key, cached in entries.items():
+        index = key & (capacity - 1)
+        while slots[index] is not None:
+            index = (index + 1) & (capacity - 1)
+        slots[index] = (key, cached)
+    empty = RECORD.pack(0, 0.0, 0, 0)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(pack_header(MAGIC, capacity, geometry))
+        for slot in slots:
+            if slot is None:
+                file.write(empty)
+            else:
+                key, cached = slot
+                file.write(RECORD.pack(
+                    key, cached.value, cached.depth, cached.move))
+    os.replace(temp_path, path)
+    return len(entries)
+
+
+def merge_journals(path):
+    """Merges the journals of all processes into the table file at `path`
+    and deletes them.
+
+    Returns:
+        The number of positions in the table file.
+    """
+    journals = glob.glob(f'{glob.escape(path)}.*.journal')
+    count = merge(path, journals)
+    for journal in journals:
+        os.remove(journal)
+    return count
@@ -1,25 +1,91 @@
 import math
-from heapq import heappush
 
-from grid import DIRECTIONS, Grid
+import vectorized
+from expectimax import Expectimax
+from grid import (
+    DIRECTIONS, OFFSETS, Grid, inverse_transform, transform_cell,
+    transform_direction)
+from line_eval import LineEvaluator
 from minimax import Minimax, PrioritizedItem
 
+SPAWN_PROBABILITIES = ((2, 0.9), (4, 0.1))
+
 
 class PlayerAI(Minimax):
-    """Minimax for 2048."""
-    def __init__(self, time_limit=0.1):
-        super().__init__(time_limit)
+    """Minimax for 2048. Keyword arguments other than the attributes below
+    are passed to `Minimax`.
+
+    Attributes:
+        batch_threshold: Min number of boards evaluated together with NumPy
+            when it is installed and line tables are not used, fewer are
+            evaluated one by one.
+        line_evaluator: If set, boards are evaluated from its per-line
+            tables instead of by `evaluate_board`.
+        symmetry: If True, rotated and reflected boards share their entries
+            in the function caches, since the evaluation does not depend on
+            the orientation.
+    """
+    weights = (10, 1, 1, 1, -1, 10, 1)
+
+    def __init__(
+            self, time_limit=0.1, batch_threshold=8,
+            line_tables=True, validate=False, symmetry=False, **kwargs):
+        super().__init__(time_limit, **kwargs)
         self.verbose = False
+        self.symmetry = symmetry
+        self.batch_threshold = batch_threshold
+        self.line_evaluator = None
+        if line_tables:
+            self.line_evaluator = LineEvaluator(
+                self.weights, self.evaluate_board if validate else None)
 
     def terminal_test(self, state: Grid, depth):
         return depth == 0 or not state.can_move()
 
     def hashkey(self, state: Grid):
-        return tuple(tuple(row) for row in state.grid)
+        return state.hash
+
+    def node_key(self, state: Grid, maximizing):
+        # The hashes are non-negative, so max nodes get the negative keys.
+        return ~state.hash if maximizing else state.hash
+
+    def canonical(self, state: Grid):
+        if not self.symmetry:
+            return state.hash, None
+        return state.canonical()
+
+    def transform_value(
+            self, state: Grid, name, value, transform, inverse=False):
+        if not transform or name == 'evaluate':
+            return value
+        if inverse:
+            transform = inverse_transform(transform)
+        if name == 'children_max':
+            return tuple(
+                transform_direction(transform, move) for move in value)
+        if name == 'children_min':
+            return tuple(
+                (transform_cell(transform, *cell, state.height, state.width),
+                 tile_value)
+                for cell, tile_value in value)
+        return value
+
+    def urgency(self, state: Grid):
+        """Scales the time of a move from 2 on a full board down to 0.5 on
+        an empty one.
+        """
+        empty = len(state.get_available_cells()) / (state.height * state.width)
+        return 2 ** (1 - 2 * empty)
 
     def _evaluate(self, state: Grid):
+        if self.line_evaluator is not None:
+            return self.line_evaluator.evaluate(state)
+        return self.evaluate_board(state)
+
+    def evaluate_board(self, state: Grid):
+        """Returns the evaluation score computed from the whole board."""
         grid = state
-        weights = [10, 1, 1, 1, -1, 10, 1]
+        weights = self.weights
         matrix = self.get_log_matrix(grid.grid)
         available_number_of_cells = len(grid.get_available_cells())
         average_tile_number = (
@@ -39,6 +105,29 @@ class PlayerAI(Minimax):
             + weights[6] * self.ordering(matrix))
         return score
 
+    def batch_evaluation(self, count):
+        return (
+            self.line_evaluator is None and count >= self.batch_threshold
+            and vectorized.available())
+
+    def snapshot(self, state: Grid):
+        return state.clone()
+
+    def _evaluate_batch(self, states):
+        if not vectorized.available():
+            return super()._evaluate_batch(states)
+        return vectorized.evaluate_batch(
+            [state.grid for state in states], self.weights)
+
+    def make(self, state: Grid, move):
+        if isinstance(move, int):
+            return state.make_move(move)
+        (row, col), tile_value = move
+        return state.make_tile(row, col, tile_value)
+
+    def unmake(self, state: Grid, undo):
+        state.unmake(undo)
+
     @staticmethod
     def get_log_matrix(matrix):
         return tuple(tuple(
@@ -91,50 +180,78 @@ class PlayerAI(Minimax):
 
     def _children_min(self, state: Grid):
         grid = state
-        cells = grid.get_available_cells()
-        children = []
-        for cell in cells:
+        moves = []
+        for cell in grid.get_available_cells():
             for tile_value in [2, 4]:
-                child = grid.clone()
-                child.set_tile(cell[0], cell[1], tile_value)
-                if self.order:
-                    heappush(
-                        children,
-                        PrioritizedItem(
-                            self.evaluate(child), child))
-                else:
-                    children.append(child)
-                self.timeout()
-        return tuple(children)
+                moves.append((cell, tile_value))
+        self.timeout()
+        if not self.order:
+            return [PrioritizedItem(0, move) for move in moves]
+        rows = grid.grid
+        return [
+            PrioritizedItem(self.spawn_priority(rows, *move), move)
+            for move in moves]
+
+    @staticmethod
+    def spawn_priority(rows, cell, tile_value):
+        """Returns a cheap score of a spawn on the board `rows`, lower for
+        the spawns searched first: next to the largest tiles, 4 before 2.
+        """
+        row, col = cell
+        height, width = len(rows), len(rows[0])
+        score = 0
+        for d_row, d_col in OFFSETS:
+            if 0 <= row + d_row < height and 0 <= col + d_col < width:
+                score -= rows[row + d_row][col + d_col]
+        return score, -tile_value
 
     def _children_max(self, state: Grid):
         grid = state
-        children = []
-        for direction in DIRECTIONS:
-            child = grid.clone()
-            if child.move(direction):
-                if self.order:
-                    heappush(
-                        children,
-                        PrioritizedItem(
-                            -self.evaluate(child), child))
-                else:
-                    children.append(child)
-            self.timeout()
-        return tuple(children)
-
-    def get_move_to_child(self, state: Grid, child: Grid):
-        grid = state
-        for direction in DIRECTIONS:
-            grid_copy = grid.clone()
-            grid_copy.move(direction)
-            if grid_copy.grid == child.grid:
-                if self.verbose:
-                    matrix = self.get_log_matrix(child.grid)
-                    print(
-                        self.depth - 1,
-                        self.diff_between_adj_tiles(matrix),
-                        self.potential_merging(matrix),
-                        self.ordering(matrix))
-                return direction
-        return None
+        moves = [
+            direction for direction in DIRECTIONS
+            if grid.changes(direction)]
+        self.timeout()
+        if not self.order:
+            return [PrioritizedItem(0, move) for move in moves]
+        scores = self.evaluate_children(grid, moves)
+        return [
+            PrioritizedItem(-score, move)
+            for score, move in zip(scores, moves)]
+
+    def deepen(self, state: Grid, stats=None):
+        move = super().deepen(state, stats)
+        if self.verbose and move is not None:
+            matrix = self.get_log_matrix(state.moved(move).grid)
+            print(
+                self.depth - 1,
+                self.diff_between_adj_tiles(matrix),
+                self.potential_merging(matrix),
+                self.ordering(matrix))
+        return move
+
+
+class ExpectimaxAI(Expectimax, PlayerAI):
+    """Expectimax for 2048, with tiles spawned as in
+    `Grid.insert_random_tile`.
+    """
+    def __init__(self, time_limit=0.1, **kwargs):
+        super().__init__(time_limit, **kwargs)
+
+    def transform_value(
+            self, state: Grid, name, value, transform, inverse=False):
+        if not transform or name != 'children_chance':
+            return super().transform_value(
+                state, name, value, transform, inverse)
+        moves = super().transform_value(
+            state, 'children_min', tuple(move for _, move in value),
+            transform, inverse)
+        return tuple(
+            (probability, move)
+            for (probability, _), move in zip(value, moves))
+
+    def _children_chance(self, state: Grid):
+        cells = state.get_available_cells()
+        return tuple(
+            (probability / len(cells), (cell, tile_value))
+            for cell in cells
+            for tile_value, probability in SPAWN_PROBABILITIES)
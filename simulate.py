@@ -0,0 +1,259 @@
+import argparse
+import csv
+import json
+import random
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from bitboard import BitGrid
+from game_trace import TraceWriter, merge_traces, trace_path
+from grid import Grid
+from parallel import RootParallelAI
+from persistent_cache import PersistentCache, journal_path, merge_journals
+from player_ai import ExpectimaxAI, PlayerAI
+from stats import StatsWriter
+from time_manager import TimeManager
+
+ENGINES = {'grid': Grid, 'bitboard': BitGrid}
+PLAYERS = {
+    'minimax': PlayerAI, 'expectimax': ExpectimaxAI,
+    'parallel': RootParallelAI}
+
+
+def play_game(
+        seed, height=4, width=4, time_limit=0.1,
+        engine='grid', player='minimax', max_moves=None, stats=None,
+        cache=None, cache_depth=0, max_depth=None, max_nodes=None,
+        time_budget=None, budget_moves=100, symmetry=False, trace=None,
+        table_size=None, cache_size=None):
+    """Plays one game without GUI and returns its record.
+
+    The search of each move stops at `time_limit`, `max_depth` or
+    `max_nodes`, whichever comes first. Without time limit, the game only
+    depends on the seed and the budgets. If `time_budget` is set, it is
+    shared over every `budget_moves` moves by a `TimeManager` instead.
+
+    If `symmetry` is True, symmetric boards share their cache entries.
+    `table_size` and `cache_size` override the capacities of the
+    transposition table and of the caches of the player.
+
+    If `stats` is a path, the search statistics of every move are appended
+    to it as JSON lines.
+
+    If `cache` is the path of a `PersistentCache`, its moves searched at
+    least `cache_depth` deep are played without search, and the searched
+    positions are appended to the journal of this process, to be merged
+    with `merge_journals` after the games.
+
+    If `trace` is a path, every position, move and spawned tile is recorded
+    to the trace file of this process, to be appended to `trace` with
+    `merge_traces` after the games.
+
+    The tiles are spawned by a random number generator seeded with `seed`,
+    owned by the grid of this game.
+    """
+    grid = ENGINES[engine](
+        height=height, width=width, rng=random.Random(seed))
+    options = {}
+    if symmetry:
+        options['symmetry'] = True
+    if table_size is not None:
+        options['table_size'] = table_size
+    if cache_size is not None:
+        options['cache_size'] = cache_size
+    player_ai = PLAYERS[player](
+        time_limit=time_limit, max_depth=max_depth, max_nodes=max_nodes,
+        **options)
+    if time_budget is not None:
+        player_ai.time_manager = TimeManager(time_budget, budget_moves)
+    if stats is not None:
+        player_ai.stats_hook = StatsWriter(stats)
+    if cache is not None:
+        player_ai.persistent = PersistentCache(cache, height, width, engine)
+        player_ai.persistent_depth = cache_depth
+    writer = None
+    if trace is not None:
+        writer = TraceWriter(trace_path(trace))
+        writer.start_game(height, width, seed)
+    for _ in range(2):
+        grid.insert_random_tile()
+    moves = nodes = depth = 0
+    search_time = 0.0
+    time_start = time.perf_counter()
+    try:
+        while grid.can_move() and (max_moves is None or moves < max_moves):
+            move_start = time.perf_counter()
+            move = player_ai.get_move(grid)
+            move_time = time.perf_counter() - move_start
+            search_time += move_time
+            before = grid.clone() if writer is not None else None
+            if move is None or not grid.move(move):
+                break
+            moves += 1
+            nodes += player_ai.nodes
+            depth += player_ai.depth - 1
+            spawn = grid.insert_random_tile()
+            if writer is not None:
+                writer.record(
+                    before, move, spawn, player_ai.depth - 1, move_time)
+    finally:
+        if writer is not None:
+            writer.end_game(grid)
+            writer.close()
+        player_ai.close()
+        if player_ai.stats_hook is not None:
+            player_ai.stats_hook.close()
+        if player_ai.persistent is not None:
+            player_ai.persistent.write_journal(journal_path(cache))
+            player_ai.persistent.close()
+    return {
+        'seed': seed,
+        'max_tile': grid.get_max_tile(),
+        'moves': moves,
+        'nodes': nodes,
+        'depth': depth / moves if moves else 0.0,
+        'search_time': search_time,
+        'time': time.perf_counter() - time_start,
+    }
+
+
+def summarize(records, target=2048):
+    """Returns win rate, max tile distribution and throughput of games."""
+    moves = sum(record['moves'] for record in records)
+    total_time = sum(record['time'] for record in records)
+    search_time = sum(record['search_time'] for record in records)
+    distribution = Counter(record['max_tile'] for record in records)
+    return {
+        'games': len(records),
+        'win_rate': (
+            sum(record['max_tile'] >= target for record in records)
+            / len(records) if records else 0.0),
+        'max_tiles': {
+            str(tile): distribution[tile] for tile in sorted(distribution)},
+        'moves': moves,
+        'moves_per_sec': moves / total_time if total_time else 0.0,
+        'nodes_per_sec': (
+            sum(record['nodes'] for record in records) / search_time
+            if search_time else 0.0),
+        'depth': (
+            sum(record['depth'] * record['moves'] for record in records)
+            / moves if moves else 0.0),
+    }
+
+
+def write_csv(summary, file):
+    """Writes the summary as a CSV header and row, with nested dicts such as
+    the max tile distribution flattened into one column per key.
+    """
+    row = {}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            row.update({f'{key}_{k}': v for k, v in value.items()})
+        else:
+            row[key] = value
+    writer = csv.DictWriter(file, fieldnames=list(row))
+    writer.writeheader()
+    writer.writerow(row)
+
+
+def add_game_arguments(parser):
+    """Adds the options of the played games to `parser`."""
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--columns', type=int, default=4)
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='seconds per move, 0.1 by default, none if '
+                             'a depth or node budget is given')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='seconds shared by every --budget-moves moves, '
+                             'spending more on critical moves')
+    parser.add_argument('--budget-moves', type=int, default=100)
+    parser.add_argument('--symmetry', action='store_true',
+                        help='share the cache entries of rotated and '
+                             'reflected boards')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='search depth per move')
+    parser.add_argument('--max-nodes', type=int, default=None,
+                        help='nodes visited per move')
+    parser.add_argument('--table-size', type=int, default=None,
+                        help='entries of the transposition table')
+    parser.add_argument('--cache-size', type=int, default=None,
+                        help='entries of each cache of the player')
+    parser.add_argument('--engine', choices=ENGINES, default='grid')
+    parser.add_argument('--player', choices=PLAYERS, default='minimax')
+    parser.add_argument('--max-moves', type=int, default=None)
+    parser.add_argument('--target', type=int, default=2048,
+                        help='tile that counts as a win')
+    parser.add_argument('--stats', default=None,
+                        help='JSON lines file the search statistics of '
+                             'every move are appended to')
+    parser.add_argument('--cache', default=None,
+                        help='persistent position cache file, read during '
+                             'the games and merged with the new searches '
+                             'after them')
+    parser.add_argument('--cache-depth', type=int, default=0,
+                        help='min search depth of the cached moves played')
+    parser.add_argument('--trace', default=None,
+                        help='binary file every position of the games is '
+                             'appended to, see game_trace.py')
+
+
+def game_options(args):
+    """Returns the keyword arguments of `play_game` from parsed options."""
+    time_limit = args.time_limit
+    if (time_limit is None and args.max_depth is None
+            and args.max_nodes is None):
+        time_limit = 0.1
+    return {
+        'height': args.rows, 'width': args.columns,
+        'time_limit': time_limit, 'max_depth': args.max_depth,
+        'max_nodes': args.max_nodes, 'engine': args.engine,
+        'player': args.player, 'max_moves': args.max_moves,
+        'stats': args.stats, 'cache': args.cache,
+        'cache_depth': args.cache_depth, 'time_budget': args.time_budget,
+        'budget_moves': args.budget_moves, 'symmetry': args.symmetry,
+        'trace': args.trace, 'table_size': args.table_size,
+        'cache_size': args.cache_size}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Play games headless and report the AI performance.')
+    parser.add_argument('-n', '--games', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game, incremented per game')
+    add_game_arguments(parser)
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file, stdout by default')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    records = []
+    for i in range(args.games):
+        record = play_game(args.seed + i, **game_options(args))
+        records.append(record)
+        print(
+            f"game {i + 1}/{args.games}: seed {record['seed']}, "
+            f"max tile {record['max_tile']}, {record['moves']} moves",
+            file=sys.stderr)
+    if args.cache is not None:
+        merge_journals(args.cache)
+    if args.trace is not None:
+        merge_traces(args.trace)
+    summary = summarize(records, args.target)
+    summary['config'] = game_options(args)
+    with (open(args.output, 'w', newline='', encoding='utf-8')
+          if args.output else nullcontext(sys.stdout)) as file:
+        if args.format == 'json':
+            json.dump({'summary': summary, 'games': records}, file, indent=2)
+            file.write('\n')
+        else:
+            write_csv(summary, file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from typing import Dict, List
+
+
+@dataclass
+class SearchStats:
+    """Statistics of the search of one move.
+
+    Attributes:
+        depth: Deepest completed depth.
+        nodes: Number of nodes visited, including the unfinished depth.
+        nodes_per_depth: Number of nodes visited by each completed depth.
+        cutoffs: Number of alpha-beta cutoffs.
+        cutoffs_per_depth: Number of cutoffs of each completed depth.
+        time: Wall time of the move.
+        times: Time spent in each profiled function, excluding the time of
+            the profiled functions it calls.
+        caches: Hits and misses of each cache during the move.
+    """
+    depth: int = 0
+    nodes: int = 0
+    nodes_per_depth: List[int] = field(default_factory=list)
+    cutoffs: int = 0
+    cutoffs_per_depth: List[int] = field(default_factory=list)
+    time: float = 0.0
+    times: Dict[str, float] = field(default_factory=dict)
+    caches: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    @property
+    def branching_factor(self):
+        """Growth of the number of nodes between the last two depths."""
+        if len(self.nodes_per_depth) < 2 or not self.nodes_per_depth[-2]:
+            return 0.0
+        return self.nodes_per_depth[-1] / self.nodes_per_depth[-2]
+
+    def to_dict(self):
+        """Returns the statistics as a JSON serializable dict."""
+        return {**asdict(self), 'branching_factor': self.branching_factor}
+
+
+class Profiler:
+    """Accumulates the exclusive time of wrapped functions.
+
+    Attributes:
+        times: Exclusive time of each wrapped function by name.
+    """
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+
+    def wrap(self, name, func):
+        """Returns `func` timed under `name`."""
+        self.times.setdefault(name, 0.0)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            time_start = time.perf_counter()
+            self.stack.append(0.0)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - time_start
+                self.times[name] += elapsed - self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+        return wrapper
+
+
+class StatsWriter:
+    """Hook that appends the statistics of every move to a JSON lines file.
+
+    Attributes:
+        file: File object written to.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, stats: SearchStats):
+        self.file.write(json.dumps(stats.to_dict()) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -1,6 +1,27 @@
+import asyncio
+import math
+import random
+import threading
+import time
+
 import pytest
 
-from grid import Grid
+from benchmark import benchmarks, compare, load_corpus
+from bitboard import BitGrid, move_tables, to_value
+from game_trace import TraceWriter, iter_records, merge_traces
+from grid import (
+    DIRECTIONS, DOWN, LEFT, RIGHT, Grid, symmetries, transform_cell,
+    transform_direction)
+from minimax import SearchTimeout
+from move_client import MoveClient
+from move_server import MoveServer
+from parallel import RootParallelAI
+from persistent_cache import PersistentCache, fold_key, merge_journals
+from player_ai import ExpectimaxAI, PlayerAI
+from simulate import PLAYERS, play_game, summarize
+from time_manager import TimeManager
+from transposition import EXACT, LOWER, LRUCache, TranspositionTable
+from vectorized import evaluate_batch
 
 
 @pytest.mark.parametrize(
@@ -13,3 +34,513 @@ from grid import Grid
     ])
 def test_merge(before, after):
     assert Grid.merge(before) == after
+
+
+@pytest.mark.parametrize("length, bits", [(4, 4), (3, 5)])
+def test_move_table(length, bits):
+    for line in range(1 << (length * bits)):
+        values = [
+            to_value((line >> (i * bits)) & ((1 << bits) - 1))
+            for i in range(length)]
+        if max(Grid.merge(values)) > 1 << ((1 << bits) - 1):
+            with pytest.raises(ValueError):
+                move_tables(length, bits)[0].__missing__(line)
+            continue
+        merged = move_tables(length, bits)[0][line]
+        assert [
+            to_value((merged >> (i * bits)) & ((1 << bits) - 1))
+            for i in range(length)] == Grid.merge(values)
+
+
+def test_bitgrid_overflow():
+    rows = [[32768, 32768, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 2]]
+    bitgrid = BitGrid(grid=rows, bits=4)
+    with pytest.raises(ValueError):
+        bitgrid.move(LEFT)
+    assert bitgrid.grid == rows and not bitgrid.move(DOWN)
+    bitgrid, grid = BitGrid(grid=rows), Grid(grid=rows)
+    assert bitgrid.can_move() and bitgrid.changes(LEFT)
+    assert bitgrid.move(LEFT) and grid.move(LEFT)
+    assert bitgrid.grid == grid.grid and bitgrid.get_max_tile() == 65536
+
+
+def test_bitgrid_sizes():
+    small = BitGrid(grid=[[2, 4, 0], [0] * 3, [0] * 3], bits=5)
+    large = BitGrid(grid=[[2, 4, 0, 0, 0]] + [[0] * 5] * 4)
+    assert small.board == large.board and small.hash != large.hash
+    assert small.canonical()[0] != large.canonical()[0]
+    player = PlayerAI()
+    assert len(player.children_min(small)) == 14
+    assert len(player.children_min(large)) == 46
+
+
+@pytest.mark.parametrize("height, width", [(4, 4), (5, 5), (3, 6)])
+def test_bitgrid(height, width):
+    rng = random.Random(height * width)
+    for _ in range(200):
+        rows = [
+            [rng.choice([0, 0, 2, 2, 4, 8, 16]) for _ in range(width)]
+            for _ in range(height)]
+        grid, bitgrid = Grid(grid=rows), BitGrid(grid=rows)
+        assert bitgrid.grid == grid.grid
+        assert bitgrid.get_available_cells() == grid.get_available_cells()
+        assert bitgrid.get_max_tile() == grid.get_max_tile()
+        for direction in DIRECTIONS:
+            assert bitgrid.can_move([direction]) == grid.can_move([direction])
+            grid_copy, bitgrid_copy = grid.clone(), bitgrid.clone()
+            change = grid_copy.move(direction)
+            assert bitgrid_copy.move(direction) == change
+            assert bitgrid_copy.grid == grid_copy.grid
+            assert grid.changes(direction) == change
+            assert bitgrid.changes(direction) == change
+            if change:
+                assert grid.moved(direction).grid == grid_copy.grid
+                assert bitgrid.moved(direction).grid == grid_copy.grid
+            else:
+                assert grid.moved(direction) is None
+
+
+def test_expectimax():
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [0, 8, 8, 2]])
+    player = ExpectimaxAI(time_limit=0.05)
+    outcomes = player.children_chance(grid)
+    assert len(outcomes) == 2
+    assert math.isclose(sum(probability for probability, _ in outcomes), 1)
+    assert player.get_move(grid.clone()) in (LEFT, RIGHT)
+
+
+def test_transposition_table():
+    table = TranspositionTable(capacity=1)
+    table.store('a', 3, 1.0, EXACT, 0)
+    table.store('b', 2, 2.0, EXACT, 0)
+    assert table.probe('b') is None
+    assert table.probe('a').value == 1.0
+    table.new_search()
+    table.store('b', 2, 2.0, LOWER, 1)
+    assert table.probe('b').flag == LOWER
+    assert (table.hits, table.misses, table.evictions) == (2, 1, 1)
+
+
+def test_lru_cache():
+    cache = LRUCache(capacity=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache and cache.evictions == 1
+
+
+def test_zobrist_hash():
+    rng = random.Random(0)
+    grid = Grid(height=5, width=4)
+    hashes = {}
+    for _ in range(300):
+        cells = grid.get_available_cells()
+        if not cells:
+            break
+        row, col = rng.choice(cells)
+        grid.set_tile(row, col, rng.choice([2, 4]))
+        grid.move(rng.choice(DIRECTIONS))
+        assert grid.hash == Grid(grid=grid.grid).hash
+        hashes.setdefault(grid.hash, grid.grid)
+        assert hashes[grid.hash] == grid.grid
+    assert grid.clone().hash == grid.hash
+
+
+def test_evaluate_batch():
+    pytest.importorskip('numpy')
+    rng = random.Random(1)
+    player = PlayerAI()
+    for height, width in [(4, 4), (5, 3)]:
+        grids = [
+            Grid(grid=[
+                [rng.choice([0, 2, 4, 8, 64, 1024]) for _ in range(width)]
+                for _ in range(height)])
+            for _ in range(50)]
+        grids = [grid for grid in grids if grid.get_max_tile() > 0]
+        scores = evaluate_batch([grid.grid for grid in grids], player.weights)
+        for grid, score in zip(grids, scores):
+            assert math.isclose(score, player._evaluate(grid))
+
+
+def test_simulate():
+    records = [
+        play_game(seed, time_limit=0.01, max_moves=5) for seed in (0, 1)]
+    assert all(record['moves'] == 5 for record in records)
+    summary = summarize(records, target=8)
+    assert summary['games'] == 2 and summary['moves'] == 10
+    assert sum(summary['max_tiles'].values()) == 2
+
+
+@pytest.mark.parametrize("grid_class", [Grid, BitGrid])
+def test_grid_rng(grid_class):
+    grids = [grid_class(rng=random.Random(7)) for _ in range(2)]
+    for _ in range(8):
+        for grid in grids:
+            grid.insert_random_tile()
+    assert grids[0].grid == grids[1].grid
+
+
+def test_root_parallel():
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 8, 8, 2]])
+    player = RootParallelAI(time_limit=0.5, workers=2)
+    try:
+        assert player.get_move(grid.clone()) in (LEFT, RIGHT)
+        assert player.depth >= 2
+        player.time_manager = TimeManager(10)
+        with pytest.raises(ValueError):
+            player.get_move(grid.clone())
+    finally:
+        player.close()
+    record = play_game(0, time_limit=0.05, player='parallel', symmetry=True,
+                       max_moves=2)
+    assert record['moves'] == 2
+
+
+def test_deadline():
+    player = PlayerAI(time_limit=0.05)
+    player.set_deadline(time.monotonic() - 1)
+    with pytest.raises(SearchTimeout):
+        player.timeout()
+    player = PlayerAI(time_limit=0.05, soft_deadline=True)
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [0, 8, 8, 2]])
+    time_start = time.monotonic()
+    assert player.get_move(grid) is not None
+    assert time.monotonic() - time_start < 0.1
+
+
+@pytest.mark.parametrize("player", ['minimax', 'expectimax'])
+def test_player_options(player):
+    player_ai = PLAYERS[player](0.1, table_size=1024, cache_size=16)
+    assert player_ai.table.capacity == 1024 and player_ai.cache_size == 16
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [0, 8, 8, 2]])
+    assert player_ai.get_move(grid) is not None
+    record = play_game(0, time_limit=None, max_depth=2, max_moves=3,
+                       player=player, table_size=1024, cache_size=16)
+    assert record['moves'] == 3
+
+
+def test_search_stats():
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [0, 8, 8, 2]])
+    player = PlayerAI(time_limit=0.05)
+    streamed = []
+    player.stats_hook = streamed.append
+    move, stats = player.get_move(grid, stats=True)
+    assert move is not None and streamed == [stats]
+    assert stats.depth == len(stats.nodes_per_depth) > 0
+    assert stats.nodes >= sum(stats.nodes_per_depth)
+    assert set(stats.times) == {'evaluate', 'children_min', 'children_max'}
+    assert '_evaluate' not in vars(player)
+
+
+def test_search_order():
+    player = PlayerAI()
+    children = tuple((cell, 2) for cell in range(5))
+    player.record_cutoff((3, 2), ply=1, depth=2)
+    player.record_cutoff((4, 2), ply=2, depth=3)
+    assert list(player.search_order(children, 2, ply=1)) == [2, 3, 4, 0, 1]
+    assert list(player.search_order(children, None)) == [0, 1, 2, 3, 4]
+
+
+def test_staged_order():
+    grid = Grid(grid=[[2, 4, 8, 16], [0, 2, 4, 8], [0, 0, 2, 4], [0, 0, 0, 2]])
+    player = PlayerAI()
+    player.killers = player.history = False
+    children = player.children_min(grid)
+    assert children[0] == ((1, 0), 4)
+    order = iter(player.search_order(children, 3, ply=1, state=grid))
+    assert [next(order) for _ in range(3)] == [3, 0, 1]
+    assert 'evaluate' not in player.caches
+    rest = list(order)
+    assert sorted(rest) == [2] + list(range(4, len(children)))
+    scores = []
+    for i in rest:
+        undo = grid.make_tile(*children[i][0], children[i][1])
+        scores.append(player.evaluate(grid))
+        grid.unmake(undo)
+    assert scores == sorted(scores)
+
+
+def test_node_key():
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 0, 4], [0, 8, 8, 2]])
+    values = {}
+    for maximizing in (True, False):
+        player = PlayerAI(time_limit=None, max_depth=3)
+        player.set_deadline(math.inf)
+        player.root_depth = 2
+        search = player.maximize if maximizing else player.minimize
+        values[maximizing] = search(grid, -math.inf, math.inf, 2)
+    player = PlayerAI(time_limit=None, max_depth=3)
+    player.set_deadline(math.inf)
+    player.root_depth = 2
+    for maximizing in (True, False, True):
+        search = player.maximize if maximizing else player.minimize
+        assert search(grid, -math.inf, math.inf, 2) == values[maximizing]
+    assert values[True][1] != values[False][1]
+    keys = {player.node_key(grid, True), player.node_key(grid, False)}
+    assert all(player.table.peek(key) for key in keys) and len(keys) == 2
+
+
+def test_aspiration():
+    grid = Grid(grid=[[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [0, 8, 8, 2]])
+    player = PlayerAI(time_limit=1)
+    index, value = player.search(grid, 3)
+    for aspiration in (0.01, 100):
+        player = PlayerAI(time_limit=1, aspiration=aspiration)
+        assert player.search_window(grid, 3, value + 1) == (index, value)
+
+
+@pytest.mark.parametrize("grid_class", [Grid, BitGrid])
+def test_make_unmake(grid_class):
+    rows = [[2, 2, 0, 4], [0, 4, 4, 8], [2, 0, 2, 2], [16, 8, 0, 0]]
+    grid = grid_class(grid=rows)
+    for direction in DIRECTIONS:
+        undo = grid.make_move(direction)
+        assert grid.grid == grid_class(grid=rows).moved(direction).grid
+        grid.unmake(undo)
+        assert grid.grid == rows and grid.hash == grid_class(grid=rows).hash
+    grid.unmake(grid.make_tile(0, 2, 4))
+    assert grid.grid == rows
+    player = PlayerAI(time_limit=0.02)
+    player.get_move(grid)
+    assert grid.grid == rows
+
+
+@pytest.mark.parametrize("grid_class", [Grid, BitGrid])
+def test_line_evaluator(grid_class):
+    rng = random.Random(2)
+    player = PlayerAI(validate=True)
+    for height, width in [(4, 4), (3, 5)]:
+        for _ in range(100):
+            grid = grid_class(grid=[
+                [rng.choice([0, 2, 4, 8, 64, 1024]) for _ in range(width)]
+                for _ in range(height)])
+            if grid.get_max_tile() > 0:
+                player.evaluate(grid)
+    player.line_evaluator.reference = lambda grid: 0
+    with pytest.raises(RuntimeError):
+        player._evaluate(grid_class(grid=[[2, 4], [0, 8]]))
+
+
+def test_persistent_cache(tmp_path):
+    path = str(tmp_path / 'positions.bin')
+    play_game(0, time_limit=0.01, max_moves=5, cache=path)
+    assert merge_journals(path) == 5
+    assert not list(tmp_path.glob('*.journal'))
+    grid = Grid(grid=[[2, 0, 0, 0], [0, 0, 0, 0], [0, 0, 2, 0], [0, 0, 0, 0]])
+    player_ai = PlayerAI(time_limit=0.01)
+    player_ai.persistent = PersistentCache(path, 4, 4, 'grid')
+    player_ai.persistent.record(grid.hash, RIGHT, 1.0, 99)
+    player_ai.get_move(grid)
+    player_ai.persistent.write_journal(path + '.0.journal')
+    player_ai.persistent.close()
+    assert merge_journals(path) == 6
+    player_ai.persistent = PersistentCache(path, 4, 4, 'grid')
+    assert player_ai.persistent.get(grid.hash).depth == 99
+    assert player_ai.get_move(grid) == RIGHT and player_ai.nodes == 0
+    player_ai.persistent.close()
+    assert fold_key(1 << 70) == 1 << 6
+    with pytest.raises(ValueError):
+        PersistentCache(path, 4, 4, 'bitboard')
+    with pytest.raises(ValueError):
+        play_game(0, height=3, width=3, max_moves=1, cache=path)
+    cache = PersistentCache(path + '.bin', 3, 3, 'grid')
+    cache.record(grid.hash, RIGHT, 1.0, 1)
+    cache.write_journal(path + '.1.journal')
+    with pytest.raises(ValueError):
+        merge_journals(path)
+
+
+def test_trace(tmp_path):
+    path = str(tmp_path / 'games.trace')
+    for seed in (0, 1):
+        record = play_game(
+            seed, engine='bitboard', time_limit=None, max_depth=1,
+            max_moves=20, trace=path)
+    merge_traces(path)
+    assert not list(tmp_path.glob('*.part'))
+    records = list(iter_records(path))
+    assert [r.index for r in records] == [0] * 21 + [1] * 21
+    final = records[-1]
+    assert final.move is None and final.game.seed == 1
+    assert max(map(max, final.rows())) == record['max_tile']
+    for record, after in zip(records, records[1:]):
+        if record.move is None:
+            continue
+        grid = Grid(grid=record.rows())
+        assert grid.move(record.move)
+        grid.set_tile(*record.spawn, record.spawn_value)
+        assert grid.grid == after.rows() and record.depth == 1
+    writer = TraceWriter(path)
+    writer.start_game(2, 2)
+    writer.record(Grid(grid=[[2, 0], [0, 65536]]), RIGHT, ((1, 0), 4))
+    writer.file.flush()
+    last = list(iter_records(path))[-1]
+    assert last.rows() == [[2, 0], [0, 65536]] and last.spawn == (1, 0)
+    writer.close()
+
+
+def test_move_server(tmp_path):
+    rows = [[2, 0, 0, 0], [0, 0, 0, 0], [0, 0, 2, 0], [0, 0, 0, 4]]
+    server = MoveServer(time_limit=None, max_depth=2)
+
+    async def coalesce():
+        await server.start()
+        try:
+            return await asyncio.gather(
+                server.get_move(rows), server.get_move(rows))
+        finally:
+            await server.close()
+
+    first, second = asyncio.run(coalesce())
+    assert first == second and first[0] in DIRECTIONS and first[1] == 2
+    assert server.stats.requests == 2 and server.stats.coalesced == 1
+    assert server.stats.searches == 1
+
+    boards = [
+        [[2, 4, 0], [0, 2, 0], [0, 0, 0]],
+        [[2, 4, 0, 0, 0], [0, 2, 0, 0, 0]] + [[0] * 5] * 3]
+    server = MoveServer(engine='bitboard', time_limit=None, max_depth=2)
+
+    async def mixed_sizes():
+        await server.start()
+        try:
+            return [(await server.get_move(board))[0] for board in boards]
+        finally:
+            await server.close()
+
+    expected = []
+    for board in boards:
+        player = PlayerAI(time_limit=None, max_depth=2)
+        expected.append(player.get_move(BitGrid(grid=board)))
+    assert asyncio.run(mixed_sizes()) == expected
+
+    address = f"unix:{tmp_path / 'server.sock'}"
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(MoveServer(time_limit=0.01).serve(address))
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(asyncio.wait([task]),))
+    thread.start()
+    try:
+        for _ in range(100):
+            if (tmp_path / 'server.sock').exists():
+                break
+            time.sleep(0.05)
+        client = MoveClient(address)
+        assert client.get_move(Grid(grid=rows)) in DIRECTIONS
+        assert client.depth >= 2 and client.nodes > 0
+        assert client.stats()['searches'] == 1
+        with pytest.raises(RuntimeError):
+            client.request({'grid': None})
+        client.close()
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+
+
+def test_benchmark():
+    corpus = load_corpus()
+    assert set(corpus) == {'4x4', '5x5', '6x6'}
+    grids = [Grid(grid=board) for board in corpus['4x4']]
+    before = [grid.grid for grid in grids]
+    for func in benchmarks(grids, depth=1).values():
+        func()
+    assert [grid.grid for grid in grids] == before
+    assert compare({'a': 1.2, 'b': 1.05}, {'a': 1.0, 'b': 1.0}, 0.1) == [
+        ('a', 1.0, 1.2)]
+
+
+@pytest.mark.parametrize("player_class", [PlayerAI, ExpectimaxAI])
+def test_search_budget(player_class):
+    grid = Grid(rng=random.Random(3))
+    for _ in range(6):
+        grid.insert_random_tile()
+    for budget in ({'max_depth': 3}, {'max_nodes': 500}):
+        results = []
+        for _ in range(2):
+            player_ai = player_class(time_limit=None, **budget)
+            results.append(
+                (player_ai.get_move(grid), player_ai.nodes, player_ai.depth))
+        assert results[0] == results[1]
+    assert results[0][1] == 500
+    # The root lookups after the last depth miss a tiny cache.
+    for max_nodes in (100, 500, 1000, 3000):
+        player_ai = player_class(
+            time_limit=None, max_nodes=max_nodes, cache_size=2)
+        assert player_ai.get_move(grid) in player_ai.root_children(grid)
+    with pytest.raises(ValueError):
+        player_class(time_limit=None)
+    records = [
+        play_game(0, time_limit=None, max_depth=2, max_moves=10)
+        for _ in range(2)]
+    assert [record['nodes'] for record in records] == [
+        records[0]['nodes']] * 2
+
+
+def test_ponder():
+    grid = Grid(grid=[[2, 4, 8, 16], [0, 2, 4, 8], [0, 0, 2, 4], [0, 0, 0, 2]])
+    player_ai = PlayerAI(time_limit=0.05)
+    assert grid.move(LEFT)
+    player_ai.start_pondering(grid.clone(), 0.05)
+    time.sleep(0.01)
+    player_ai.stop_pondering()
+    assert player_ai.ponder_thread is None and player_ai.ponder_nodes > 0
+    grid.set_tile(3, 3, 2)
+    assert player_ai.table.peek(player_ai.node_key(grid, True)) is not None
+    age = player_ai.table.age
+    player_ai.start_pondering(grid.clone())
+    assert player_ai.get_move(grid) in DIRECTIONS
+    assert player_ai.ponder_thread is None
+    assert player_ai.table.age == age + 1
+    player_ai.get_move(grid)
+    assert player_ai.table.age == age + 2
+
+
+def test_time_manager():
+    manager = TimeManager(budget=1.0, moves=10)
+    target, limit = manager.allocate()
+    assert target == pytest.approx(0.1) and limit == pytest.approx(0.3)
+    assert manager.allocate(urgency=2)[0] == pytest.approx(0.2)
+    manager.record(0.0)
+    assert manager.allocate()[0] == pytest.approx(0.11)
+    assert manager.should_stop(0.1, 0.1, False)
+    assert not manager.should_stop(0.1, 0.1, True)
+    assert not manager.should_stop(0.1, 0.1, False, margin=1.0)
+    assert manager.should_stop(0.1, 0.1, False, margin=1.0, exact=False)
+    assert manager.should_stop(0.03, 0.1, True, margin=100.0)
+    player_ai = PlayerAI(time_limit=None, max_depth=3)
+    player_ai.time_manager = manager
+    grid = Grid(height=1, width=4, grid=[[0, 2, 4, 8]])
+    assert player_ai.get_move(grid) == LEFT and player_ai.nodes == 0
+    assert manager.played == 2
+    record = play_game(0, time_budget=0.1, budget_moves=10, max_moves=10)
+    assert record['moves'] == 10
+
+
+@pytest.mark.parametrize("grid_class", [Grid, BitGrid])
+@pytest.mark.parametrize("height, width", [(4, 4), (3, 5)])
+def test_symmetry(grid_class, height, width):
+    grid = grid_class(height=height, width=width, rng=random.Random(2))
+    for _ in range(7):
+        grid.insert_random_tile()
+    player_ai = PlayerAI(time_limit=None, max_depth=2, symmetry=True)
+    children = player_ai.children_max(grid)
+    spawns = set(player_ai.children_min(grid))
+    assert len(symmetries(height, width)) == (8 if height == width else 4)
+    for transform in symmetries(height, width):
+        shape = (width, height) if transform & 4 else (height, width)
+        rows = [[0] * shape[1] for _ in range(shape[0])]
+        for row in range(height):
+            for col in range(width):
+                cell = transform_cell(transform, row, col, height, width)
+                rows[cell[0]][cell[1]] = grid.get_tile(row, col)
+        other = grid_class(grid=rows)
+        assert other.canonical()[0] == grid.canonical()[0]
+        assert player_ai.children_max(other) == tuple(
+            transform_direction(transform, move) for move in children)
+        assert set(player_ai.children_min(other)) == {
+            (transform_cell(transform, *cell, height, width), value)
+            for cell, value in spawns}
+        assert player_ai.get_move(other) in player_ai.children_max(other)
+    assert player_ai.caches['children_max'].misses == 1
@@ -0,0 +1,78 @@
+class TimeManager:
+    """Shares a time budget over the moves, spending more on critical moves
+    and less on forced or obvious ones.
+
+    Each move gets the average time per move, plus the time saved or minus
+    the time overspent so far spread over the next `moves` moves, scaled by
+    the urgency of the position, as a target. After the target, the search
+    stops after the current depth unless the best move changed at the last
+    depth or the runner-up is within `close_margin`, in which case it
+    continues up to `extension` times the target. A move whose runner-up
+    is at least `obvious_margin` worse stops at a fraction `min_factor` of
+    the target.
+
+    Attributes:
+        budget: Seconds for every `moves` moves. A per-game budget is
+            spread over the expected length of the game.
+        moves: Number of moves sharing `budget`.
+        min_factor: Min scale of the share of a move.
+        max_factor: Max scale of the share of a move.
+        extension: Max time of a move as a multiple of its target.
+        close_margin: Root value margin below which the best move is
+            unclear.
+        obvious_margin: Root value margin above which the best move is
+            obvious.
+        spent: Seconds spent so far.
+        played: Number of moves played so far.
+    """
+    def __init__(
+            self, budget, moves=100, min_factor=0.25, max_factor=4.0,
+            extension=3.0, close_margin=5.0, obvious_margin=50.0):
+        self.budget = budget
+        self.moves = moves
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.extension = extension
+        self.close_margin = close_margin
+        self.obvious_margin = obvious_margin
+        self.spent = 0.0
+        self.played = 0
+
+    def share(self):
+        """Returns the time of the next move before scaling by urgency."""
+        average = self.budget / self.moves
+        saved = average * self.played - self.spent
+        return max(average + saved / self.moves, average * self.min_factor)
+
+    def allocate(self, urgency=1.0):
+        """Returns the target and max time of the next move."""
+        share = self.share()
+        factor = min(max(urgency, self.min_factor), self.max_factor)
+        target = share * factor
+        limit = min(target * self.extension, share * self.max_factor)
+        return target, max(limit, target)
+
+    def should_stop(self, elapsed, target, changed, margin=None, exact=True):
+        """Returns True if the search should not start another depth.
+
+        Args:
+            elapsed: Time spent on the move so far.
+            target: Target time of the move.
+            changed: Whether the best move changed at the last depth.
+            margin: Value of the best move minus the value of the
+                runner-up, or None if unknown.
+            exact: Whether `margin` is exact rather than a lower bound,
+                which only tells whether the move is obvious.
+        """
+        if margin is not None and margin >= self.obvious_margin:
+            return elapsed >= target * self.min_factor
+        if changed:
+            return False
+        if exact and margin is not None and margin < self.close_margin:
+            return False
+        return elapsed >= target
+
+    def record(self, elapsed):
+        """Records the time of a move."""
+        self.spent += elapsed
+        self.played += 1
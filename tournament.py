@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+from game_trace import merge_traces
+from persistent_cache import merge_journals
+from simulate import add_game_arguments, game_options, play_game, summarize
+
+
+def run(seeds, workers=None, **options):
+    """Plays a game per seed in a pool of processes.
+
+    Every game owns a random number generator seeded with its seed, so the
+    spawned tiles only depend on the seed and the moves, not on the worker
+    or the order the games run in.
+
+    Yields:
+        The record of each game as soon as it completes.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(play_game, seed, **options) for seed in seeds]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Play seeded games on all cores and aggregate results.')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game, incremented per game')
+    parser.add_argument('--seeds', type=int, nargs='+', default=None,
+                        help='explicit seed list, overrides --games/--seed')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    add_game_arguments(parser)
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON lines file of the game records as they '
+                             'complete, stdout by default')
+    parser.add_argument('--summary', default=None,
+                        help='JSON file of the aggregate, stderr by default')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    seeds = (
+        args.seeds if args.seeds is not None
+        else range(args.seed, args.seed + args.games))
+    records = []
+    with (open(args.output, 'w', encoding='utf-8')
+          if args.output else nullcontext(sys.stdout)) as file:
+        for record in run(seeds, args.workers, **game_options(args)):
+            records.append(record)
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            summary = summarize(records, args.target)
+            print(
+                f"{summary['games']}/{len(seeds)} games, "
+                f"win rate {summary['win_rate']:.3f}, "
+                f"{summary['moves_per_sec']:.1f} moves/s",
+                file=sys.stderr)
+    if args.cache is not None:
+        merge_journals(args.cache)
+    if args.trace is not None:
+        merge_traces(args.trace)
+    records.sort(key=lambda record: record['seed'])
+    summary = summarize(records, args.target)
+    summary['config'] = game_options(args)
+    with (open(args.summary, 'w', encoding='utf-8')
+          if args.summary else nullcontext(sys.stderr)) as file:
+        json.dump(summary, file, indent=2)
+        file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
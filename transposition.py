@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+BOUNDS = (EXACT, LOWER, UPPER) = range(3)
+
+
+@dataclass
+class Entry:
+    """Search result of a node.
+
+    Attributes:
+        key: Hashkey of the node.
+        depth: Remaining depth the node was searched to.
+        value: Value found by the search.
+        flag: Whether `value` is `EXACT`, a `LOWER` or an `UPPER` bound.
+        best: Best move found, or None.
+        age: Search the entry was stored in.
+    """
+    key: Hashable
+    depth: int
+    value: float
+    flag: int
+    best: Any
+    age: int
+
+
+class TranspositionTable:
+    """Fixed capacity table of search results, reused across moves.
+
+    Each key maps to one slot. A slot is overwritten by the same key, by a
+    result searched at least as deep, or when it is left over from an
+    earlier search.
+
+    Attributes:
+        capacity: Number of slots.
+        age: Number of the current search.
+        hits: Number of probes that found their key.
+        misses: Number of probes that did not.
+        evictions: Number of entries overwritten by a different key.
+    """
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return sum(entry is not None for entry in self.slots)
+
+    def new_search(self):
+        """Ages the entries stored so far."""
+        self.age += 1
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        self.slots = [None] * self.capacity
+        self.hits = self.misses = self.evictions = 0
+
+    def probe(self, key) -> Optional[Entry]:
+        """Returns the entry of `key` or None."""
+        entry = self.slots[hash(key) % self.capacity]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def peek(self, key) -> Optional[Entry]:
+        """Returns the entry of `key` or None, without counting it."""
+        entry = self.slots[hash(key) % self.capacity]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, best=None):
+        """Stores a search result according to the replacement policy."""
+        index = hash(key) % self.capacity
+        entry = self.slots[index]
+        if entry is not None and entry.key != key:
+            if entry.age == self.age and entry.depth > depth:
+                return
+            self.evictions += 1
+        self.slots[index] = Entry(key, depth, value, flag, best, self.age)
+
+
+class LRUCache:
+    """Cache that discards the least recently used item when full.
+
+    Attributes:
+        capacity: Max number of items.
+        hits: Number of lookups that found their key.
+        misses: Number of lookups that did not.
+        evictions: Number of items discarded.
+    """
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        """Returns the value of `key` and marks it as recently used."""
+        try:
+            value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Stores the value of `key`, discarding the oldest item if full."""
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Removes all items and resets the counters."""
+        self.items.clear()
+        self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,54 @@
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional.
+    np = None
+
+
+def available():
+    """Returns True if NumPy can be imported."""
+    return np is not None
+
+
+def _ordering(matrix, axis):
+    diff = np.diff(matrix, axis=axis)
+    monotonic = np.all(diff <= 0, axis=axis) | np.all(diff >= 0, axis=axis)
+    line_max = matrix.max(axis=axis)
+    return np.where(monotonic, line_max, -line_max).sum(axis=1)
+
+
+def evaluate_batch(grids, weights):
+    """Returns the scores of `PlayerAI._evaluate` for a sequence of grids of
+    the same size, computing each heuristic term for all of them at once.
+
+    Args:
+        grids: Sequence of boards, each a list of rows of tile values.
+        weights: Weights of the heuristic terms.
+    """
+    tiles = np.asarray(grids, dtype=np.int64)
+    count, height, width = tiles.shape
+    matrix = np.log2(np.where(tiles > 0, tiles, 1))
+    flat = np.sort(matrix.reshape(count, -1), axis=1)
+    available_cells = (tiles == 0).sum(axis=(1, 2))
+    average_tile = flat.sum(axis=1) / (height * width - available_cells)
+    median_tile = flat[
+        np.arange(count),
+        available_cells + (height * width - available_cells) // 2]
+    max_tile = flat[:, -1]
+    diff = (
+        np.abs(np.diff(matrix, axis=2)).sum(axis=(1, 2))
+        + np.abs(np.diff(matrix, axis=1)).sum(axis=(1, 2)))
+    merging = (
+        ((matrix[:, :, :-1] == matrix[:, :, 1:]) & (matrix[:, :, 1:] != 0))
+        .sum(axis=(1, 2))
+        + ((matrix[:, :-1, :] == matrix[:, 1:, :]) & (matrix[:, 1:, :] != 0))
+        .sum(axis=(1, 2)))
+    ordering = _ordering(matrix, 2) + _ordering(matrix, 1)
+    scores = (
+        weights[0] * available_cells
+        + weights[1] * average_tile
+        + weights[2] * median_tile
+        + weights[3] * max_tile
+        + weights[4] * diff
+        + weights[5] * merging
+        + weights[6] * ordering)
+    return scores.tolist()